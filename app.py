@@ -1,47 +1,98 @@
-import streamlit as st
+import time
 
-import torch
-from transformers import pipeline, set_seed
-from transformers import AutoTokenizer
-
-from PIL import (
-    ImageFont,
-)
+_import_started = time.perf_counter()
 
+import gc
+import logging
 import os
-import re
+import copy
+import queue
 import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import textwrap
 from examples import EXAMPLES
 import dummy
 import meta
 from utils import ext
-from utils.api import generate_cook_image
-from utils.draw import generate_food_with_logo_image, generate_recipe_image
-from utils.st import (
-    remote_css,
-    local_css,
-
-)
+from utils.api import EDAMAM_API_URL, ImageLookupClient, generate_remote_recipe, generate_remote_variants
+from utils.backend import BACKENDS, load_mmap_model, load_onnx_model, load_snapshot, onnx_pipeline, save_snapshot
+from utils.batcher import GenerationBatcher, generation_key
+from utils.cache import FrameCache, RecipeCache, content_key, frame_key, is_deterministic
+from utils.draw import assets, generate_food_with_logo_image, generate_recipe_image
+from utils.encoding import ImageEncoder
+from utils.memory import format_usage, memory_usage
+from utils.parser import RecipeParser, SECTIONS
+from utils.planner import LengthPlanner
+from utils.stream import RecipeStreamParser
+from utils.telemetry import NULL_TELEMETRY, RATE_BUCKETS, TOKEN_BUCKETS, Telemetry
+from utils.variants import dedupe_recipes
+from utils.workers import WorkerPool
 from utils.utils import (
     load_image_from_url,
     load_image_from_local,
-    image_to_base64,
     pure_comma_separation
 )
 
+# torch, transformers and streamlit are imported where they are first needed, see `load_pipeline` and `main`
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+logger = logging.getLogger(__name__)
+
 
 class TextGeneration:
     def __init__(self):
         self.debug = False
         self.dummy_outputs = dummy.recipes
         self.tokenizer = None
+        self.parser = None
         self.generator = None
+        self.batcher = None
+        self.workers = None
+        self.num_workers = 0
+        self.batch_size = 8
+        self.batch_wait = 0.01
+        self.batch_bucket = 32
+        self.length_planner = None
+        self.cache = None
+        self.encoder_cache = None
+        self.frame_cache = None
+        self.telemetry = NULL_TELEMETRY
+        self.stream = True
+        self.early_stop = True
+        self.max_ingredients = None
+        self.max_directions = None
         self.api_ids = []
         self.api_keys = []
         self.api_test = 2
+        self.image_client = None
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.prefetched_images = OrderedDict()
+        self.prefetch_lock = threading.Lock()
         self.task = "text2text-generation"
         self.model_name_or_path = "flax-community/t5-recipe-generation"
+        self.backend = "pytorch"
+        self.onnx_path = "models/onnx"
+        self.service_url = None
+        self.snapshot_path = None
+        self.low_memory = False
+        self.weights_path = "models/safetensors"
+        self.weights_dtype = "float32"
+        self.idle_unload = 0
+        self.speculative = None
+        self.draft_layers = 0
+        self.draft_model = None
+        self.draft_tokens = 4
+        self.last_used = time.monotonic()
+        self.pipeline_lock = threading.RLock()
+        self.pipelines_in_use = 0
+        self.startup_timings = {}
+        self.memory = {}
+        # lossless frames with a fast png level, small photo thumbnails for the html card
+        self.frame_encoder = ImageEncoder("png", compress_level=1)
+        self.thumbnail_encoder = ImageEncoder("jpeg", quality=85, max_size=600)
         self.color_frame = "#ffffff"
         self.main_frame = "asset/frame/recipe-bg.png"
         self.no_food = "asset/frame/no_food.png"
@@ -50,44 +101,145 @@ class TextGeneration:
             "scheherazade": "asset/frame/food-image-logo-bg-s.png",
             "giovanni": "asset/frame/food-image-logo-bg-g.png",
         }
-        self.fonts = {
-            "title": ImageFont.truetype("asset/fonts/Poppins-Bold.ttf", 70),
-            "sub_title": ImageFont.truetype("asset/fonts/Poppins-Medium.ttf", 30),
-            "body_bold": ImageFont.truetype("asset/fonts/Montserrat-Bold.ttf", 22),
-            "body": ImageFont.truetype("asset/fonts/Montserrat-Regular.ttf", 18),
+        self.font_specs = {
+            "title": ("asset/fonts/Poppins-Bold.ttf", 70),
+            "sub_title": ("asset/fonts/Poppins-Medium.ttf", 30),
+            "body_bold": ("asset/fonts/Montserrat-Bold.ttf", 22),
+            "body": ("asset/fonts/Montserrat-Regular.ttf", 18),
 
         }
-        set_seed(42)
+
+    @property
+    def fonts(self):
+        # loaded on first use and kept by the asset registry
+        return {name: assets.font(path, size) for name, (path, size) in self.font_specs.items()}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = time.perf_counter() - start
 
     def _skip_special_tokens_and_prettify(self, text):
-        recipe_maps = {"<sep>": "--", "<section>": "\n"}
-        recipe_map_pattern = "|".join(map(re.escape, recipe_maps.keys()))
+        if self.parser is None:
+            self.parser = RecipeParser(self.tokenizer.all_special_tokens)
 
-        text = re.sub(
-            recipe_map_pattern,
-            lambda m: recipe_maps[m.group()],
-            re.sub("|".join(self.tokenizer.all_special_tokens), "", text)
-        )
+        return self.parser.parse(text).to_dict()
 
-        data = {"title": "", "ingredients": [], "directions": []}
-        for section in text.split("\n"):
-            section = section.strip()
-            if section.startswith("title:"):
-                data["title"] = " ".join(
-                    [w.strip().capitalize() for w in section.replace("title:", "").strip().split() if w.strip()]
-                )
-            elif section.startswith("ingredients:"):
-                data["ingredients"] = [s.strip() for s in section.replace("ingredients:", "").split('--')]
-            elif section.startswith("directions:"):
-                data["directions"] = [s.strip() for s in section.replace("directions:", "").split('--')]
+    def load_pipeline(self):
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown backend `{self.backend}`, choose one of {', '.join(BACKENDS)}")
+
+        with self.phase("import_transformers"):
+            from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline, set_seed
+
+        set_seed(42)
+        if self.backend == "pytorch" and self.low_memory:
+            with self.phase("load_model"):
+                # weights stay in the page cache, shared by every replica on the node
+                model, self.tokenizer = load_mmap_model(self.model_name_or_path, self.weights_path, self.weights_dtype)
+        elif self.backend == "pytorch" and self.snapshot_path and os.path.exists(self.snapshot_path):
+            with self.phase("load_snapshot"):
+                model, self.tokenizer = load_snapshot(self.snapshot_path)
+        else:
+            with self.phase("load_tokenizer"):
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path)
+
+            with self.phase("load_model"):
+                if self.backend == "pytorch":
+                    model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name_or_path)
+                else:
+                    model = load_onnx_model(
+                        self.model_name_or_path, self.onnx_path, quantized=self.backend == "onnx-int8"
+                    )
+
+            if self.backend == "pytorch" and self.snapshot_path:
+                with self.phase("save_snapshot"):
+                    save_snapshot(self.snapshot_path, model, self.tokenizer)
+
+        with self.phase("build_pipeline"):
+            self.parser = RecipeParser.from_tokenizer(self.tokenizer)
+            # one tokenizer instance shared by the pipeline, the parser and the streaming decoder
+            if self.backend == "pytorch":
+                self.generator = pipeline(self.task, model=model, tokenizer=self.tokenizer)
             else:
-                pass
+                self.generator = onnx_pipeline(model, self.tokenizer)
+            self._instrument_pipeline()
 
-        return data
+        self.load_draft(model)
 
-    def load_pipeline(self):
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path)
-        self.generator = pipeline(self.task, model=self.model_name_or_path, tokenizer=self.model_name_or_path)
+    def load_draft(self, model):
+        # the onnx graphs have no decoder cache that could be rewound after a rejected draft
+        if self.backend != "pytorch" or not (self.draft_layers or self.draft_model):
+            return
+
+        from utils.speculative import SpeculativeDecoder, load_draft, truncated_draft
+
+        with self.phase("load_draft"):
+            if self.draft_model:
+                draft = load_draft(self.draft_model, model)
+            else:
+                draft = truncated_draft(model, self.draft_layers)
+
+        if self.speculative is None:
+            self.speculative = SpeculativeDecoder(draft, self.draft_tokens)
+        else:
+            self.speculative.draft = draft
+
+    def _instrument_pipeline(self):
+        # tokenization happens inside the pipeline call
+        self.generator._parse_and_tokenize = self.telemetry.timed("tokenize", self.generator._parse_and_tokenize)
+
+    @contextmanager
+    def pipeline_in_use(self):
+        """Yields the pipeline, loading it again first if it was unloaded while idle."""
+        with self.pipeline_lock:
+            if self.generator is None:
+                self.load_pipeline()
+                self.memory["after_reload"] = memory_usage()
+            self.pipelines_in_use += 1
+
+        try:
+            yield self.generator
+        finally:
+            with self.pipeline_lock:
+                self.pipelines_in_use -= 1
+                self.last_used = time.monotonic()
+
+    def unload_pipeline(self):
+        with self.pipeline_lock:
+            if self.generator is None or self.pipelines_in_use:
+                return False
+
+            # the tokenizer and the parser are small and stay, the next request reloads the model
+            self.generator = None
+            if self.speculative is not None:
+                self.speculative.draft = None
+            gc.collect()
+            self.memory["after_unload"] = memory_usage()
+            return True
+
+    def load_idle_unload(self):
+        self.idle_unload = float(os.getenv("CHEF_IDLE_UNLOAD", self.idle_unload))
+        # forked workers hold the model themselves
+        if self.idle_unload <= 0 or self.workers or self.backend != "pytorch":
+            return
+
+        def unload_when_idle():
+            while True:
+                time.sleep(max(1.0, min(self.idle_unload / 4, 30.0)))
+                if self.generator is not None and time.monotonic() - self.last_used >= self.idle_unload:
+                    if self.unload_pipeline():
+                        self.telemetry.count("chef_model_unloads_total")
+                        logger.info(
+                            "Model unloaded after %.0fs idle: %s",
+                            self.idle_unload,
+                            format_usage(self.memory["after_unload"]),
+                        )
+
+        threading.Thread(target=unload_when_idle, name="idle-unload", daemon=True).start()
 
     def load_api(self):
         app_ids = os.getenv("EDAMAM_APP_ID")
@@ -102,14 +254,188 @@ class TextGeneration:
         self.api_ids = app_ids
         self.api_keys = app_keys
 
+        self.image_client = None
+        if self.api_ids and self.api_keys and len(self.api_ids) == len(self.api_keys):
+            self.image_client = ImageLookupClient(
+                self.api_ids,
+                self.api_keys,
+                base_url=os.getenv("EDAMAM_API_URL", EDAMAM_API_URL),
+                max_attempts=self.api_test + 1,
+                cache_ttl=float(os.getenv("EDAMAM_CACHE_TTL", 3600)),
+            )
+
+    def load_workers(self):
+        self.num_workers = int(os.getenv("CHEF_WORKERS", self.num_workers))
+        threads_per_worker = int(os.getenv("CHEF_WORKER_THREADS", 0)) or None
+
+        self.workers = None
+        if self.num_workers > 0:
+            if self.backend != "pytorch":
+                raise ValueError("CHEF_WORKERS needs the pytorch backend, ONNX Runtime sessions are not fork-safe")
+
+            # forked after the model is loaded, so the workers share its weights through copy-on-write
+            self.workers = WorkerPool(self._generate_ids, self.num_workers, threads_per_worker)
+            self.workers.start()
+
+    def load_batcher(self):
+        self.batch_size = int(os.getenv("CHEF_BATCH_SIZE", self.batch_size))
+        self.batch_wait = float(os.getenv("CHEF_BATCH_WAIT_MS", self.batch_wait * 1000)) / 1000
+        self.batch_bucket = int(os.getenv("CHEF_BATCH_BUCKET", self.batch_bucket))
+        length_fn = self._input_length if self.batch_bucket > 0 else None
+
+        self.batcher = None
+        if self.batch_size > 1:
+            if self.workers:
+                self.batcher = GenerationBatcher(
+                    self.workers.generate, self.batch_size, self.batch_wait, max_in_flight=self.num_workers,
+                    length_fn=length_fn, bucket_width=self.batch_bucket,
+                )
+            else:
+                self.batcher = GenerationBatcher(
+                    self._generate_ids, self.batch_size, self.batch_wait,
+                    length_fn=length_fn, bucket_width=self.batch_bucket,
+                )
+
+    def load_cache(self):
+        cache_size = int(os.getenv("CHEF_CACHE_SIZE", 256))
+        self.cache = None
+        if cache_size > 0:
+            self.cache = RecipeCache(
+                max_size=cache_size,
+                ttl=float(os.getenv("CHEF_CACHE_TTL", 0)),
+                path=os.getenv("CHEF_CACHE_PATH") or None,
+                disk_max_size=int(os.getenv("CHEF_CACHE_DISK_SIZE", 10000)),
+                variants=int(os.getenv("CHEF_CACHE_VARIANTS", 0)),
+            )
+
+    def load_length_planner(self):
+        path = os.getenv("CHEF_LENGTH_STATS", "eval/length_stats.json")
+        self.length_planner = None
+        # without mined statistics every request keeps the chef's max_length
+        if path and os.path.exists(path):
+            self.length_planner = LengthPlanner.load(path, margin=float(os.getenv("CHEF_LENGTH_MARGIN", 0.15)))
+
+    def load_encoder_cache(self):
+        cache_mb = float(os.getenv("CHEF_ENCODER_CACHE_MB", 64))
+        self.encoder_cache = None
+        # the onnx graphs run their own encoder inside `generate`
+        if cache_mb > 0 and self.backend == "pytorch":
+            from utils.generation import EncoderCache
+
+            self.encoder_cache = EncoderCache(max_bytes=int(cache_mb * 2 ** 20))
+
+    def load_encoders(self):
+        self.frame_encoder = ImageEncoder(
+            os.getenv("CHEF_FRAME_FORMAT", self.frame_encoder.format),
+            quality=int(os.getenv("CHEF_FRAME_QUALITY", self.frame_encoder.quality)),
+            compress_level=int(os.getenv("CHEF_PNG_COMPRESS_LEVEL", self.frame_encoder.compress_level)),
+            background=self.color_frame,
+        )
+        self.thumbnail_encoder = ImageEncoder(
+            os.getenv("CHEF_THUMBNAIL_FORMAT", self.thumbnail_encoder.format),
+            quality=int(os.getenv("CHEF_THUMBNAIL_QUALITY", self.thumbnail_encoder.quality)),
+            compress_level=int(os.getenv("CHEF_PNG_COMPRESS_LEVEL", self.thumbnail_encoder.compress_level)),
+            max_size=int(os.getenv("CHEF_THUMBNAIL_SIZE", self.thumbnail_encoder.max_size)) or None,
+            background=self.color_frame,
+        )
+
+    def load_frame_cache(self):
+        cache_mb = float(os.getenv("CHEF_FRAME_CACHE_MB", 64))
+        path = os.getenv("CHEF_FRAME_CACHE_DIR") or None
+        self.frame_cache = None
+        if cache_mb > 0 or path:
+            self.frame_cache = FrameCache(
+                max_bytes=int(cache_mb * 2 ** 20),
+                path=path,
+                disk_max_bytes=int(float(os.getenv("CHEF_FRAME_CACHE_DISK_MB", 512)) * 2 ** 20),
+            )
+
+    def load_telemetry(self):
+        self.telemetry = NULL_TELEMETRY
+        if os.getenv("CHEF_METRICS", "0") == "0":
+            return
+
+        self.telemetry = telemetry = Telemetry()
+        for name, seconds in self.startup_timings.items():
+            telemetry.gauge("chef_startup_seconds", lambda seconds=seconds: seconds, phase=name)
+
+        for name, cache in [("recipe", self.cache), ("encoder", self.encoder_cache), ("frame", self.frame_cache)]:
+            if cache is not None:
+                for stat, kind in [("hits", "counter"), ("misses", "counter"), ("hit_ratio", "gauge")]:
+                    metric = f"chef_cache_{stat}_total" if kind == "counter" else f"chef_cache_{stat}"
+                    telemetry.gauge(metric, lambda cache=cache, stat=stat: cache.stats()[stat], kind=kind, cache=name)
+
+        if self.batcher:
+            telemetry.gauge("chef_queue_depth", self.batcher.qsize, queue="batcher")
+        if self.workers:
+            telemetry.gauge("chef_queue_depth", self.workers.qsize, queue="workers")
+        if self.speculative is not None:
+            for stat in ("drafted", "accepted"):
+                telemetry.gauge(
+                    "chef_draft_tokens_total", lambda stat=stat: self.speculative.stats()[stat], kind="counter", type=stat
+                )
+            telemetry.gauge("chef_draft_acceptance_ratio", lambda: self.speculative.stats()["acceptance_rate"])
+        for name in ("rss_mb", "anon_mb", "file_mb", "pss_mb"):
+            telemetry.gauge("chef_memory_mb", lambda name=name: memory_usage()[name], type=name[:-3])
+        if self.generator is not None:
+            self._instrument_pipeline()
+
+        dump_path = os.getenv("CHEF_METRICS_DUMP") or None
+        if dump_path:
+            telemetry.start_dump(dump_path, float(os.getenv("CHEF_METRICS_INTERVAL", 60)))
+
+    def load_assets(self):
+        for path, size in self.font_specs.values():
+            assets.font(path, size)
+        assets.preload(
+            frame_paths=list(self.chef_frames.values()) + [self.main_frame],
+            logo_paths=[self.logo_frame],
+            background_paths=[self.main_frame],
+            bg_color=self.color_frame,
+        )
+
     def load(self):
-        self.load_api()
-        if not self.debug:
+        start = time.perf_counter()
+        self.memory["before_load"] = memory_usage()
+        self.startup_timings["import"] = IMPORT_SECONDS
+        with self.phase("load_api"):
+            self.load_api()
+
+        # frames and fonts warm up in the background, a render before that just loads them itself
+        self.executor.submit(self.load_assets)
+        self.load_encoders()
+        self.load_frame_cache()
+        self.load_length_planner()
+        self.stream = os.getenv("CHEF_STREAM", "1") != "0"
+        self.early_stop = os.getenv("CHEF_EARLY_STOP", "1") != "0"
+        self.max_ingredients = int(os.getenv("CHEF_MAX_INGREDIENTS", 0)) or None
+        self.max_directions = int(os.getenv("CHEF_MAX_DIRECTIONS", 0)) or None
+        self.backend = os.getenv("CHEF_BACKEND", self.backend)
+        self.onnx_path = os.getenv("CHEF_ONNX_PATH", self.onnx_path)
+        self.service_url = os.getenv("CHEF_SERVICE_URL") or None
+        self.snapshot_path = os.getenv("CHEF_MODEL_SNAPSHOT") or None
+        self.low_memory = os.getenv("CHEF_LOW_MEMORY", "0") != "0"
+        self.weights_path = os.getenv("CHEF_WEIGHTS_PATH", self.weights_path)
+        self.weights_dtype = os.getenv("CHEF_WEIGHTS_DTYPE", self.weights_dtype)
+        self.draft_layers = int(os.getenv("CHEF_DRAFT_LAYERS", self.draft_layers))
+        self.draft_model = os.getenv("CHEF_DRAFT_MODEL") or None
+        self.draft_tokens = int(os.getenv("CHEF_DRAFT_TOKENS", self.draft_tokens))
+        if not self.debug and not self.service_url:
             self.load_pipeline()
+            self.load_encoder_cache()
+            self.load_workers()
+            self.load_batcher()
+            self.load_cache()
+            self.load_idle_unload()
 
-    def prepare_frame(self, recipe, chef_name):
+        self.startup_timings["load"] = time.perf_counter() - start
+        self.memory["after_load"] = memory_usage()
+        self.load_telemetry()
+
+    def prepare_frame(self, recipe, chef_name, food_image=None):
         frame_path = self.chef_frames[chef_name.lower()]
-        food_logo = generate_food_with_logo_image(frame_path, self.logo_frame, recipe["image"])
+        food = food_image if food_image is not None else recipe["image"]
+        food_logo = generate_food_with_logo_image(frame_path, self.logo_frame, food, no_food=self.no_food)
         frame = generate_recipe_image(
             recipe,
             self.main_frame,
@@ -119,50 +445,378 @@ class TextGeneration:
         )
         return frame
 
-    def generate(self, items, generation_kwargs):
-        recipe = self.dummy_outputs[0]
-        # recipe = self.dummy_outputs[random.randint(0, len(self.dummy_outputs) - 1)]
+    def _recipe_processors(self, max_ingredients=None, max_directions=None):
+        from utils.generation import RecipeStopProcessor
+
+        if not self.early_stop or self.parser is None or self.parser.section_token_id is None:
+            return []
+
+        return [RecipeStopProcessor(
+            self.tokenizer.eos_token_id,
+            self.parser.section_token_id,
+            self.parser.sep_token_id,
+            max_ingredients=max_ingredients,
+            max_directions=max_directions,
+            num_sections=len(SECTIONS),
+        )]
+
+    def _token_processors(self, token_callbacks, num_return_sequences=1):
+        from utils.generation import TokenCallbackProcessor
+
+        if not token_callbacks or not any(token_callbacks):
+            return []
+
+        def observe(input_ids):
+            # the first step only holds the decoder start token
+            if input_ids.shape[-1] > 1:
+                for i, callback in enumerate(token_callbacks):
+                    if callback is not None:
+                        callback(int(input_ids[i * num_return_sequences, -1]))
+
+        return [TokenCallbackProcessor(observe)]
+
+    def _generate_ids(self, items_list, generation_kwargs, token_callbacks=None):
+        """`token_callbacks` (one per input, or None) get every token of the first sequence as it is decoded."""
+        from utils.generation import generation_hooks
+
+        generation_kwargs = dict(generation_kwargs)
+        # recipe caps travel with the generation kwargs, so they are part of the cache and batch keys
+        processors = self._recipe_processors(
+            generation_kwargs.pop("max_ingredients", None) or self.max_ingredients,
+            generation_kwargs.pop("max_directions", None) or self.max_directions,
+        )
+        num_return_sequences = generation_kwargs.get("num_return_sequences", 1)
+
+        with self.pipeline_in_use() as generator, generation_hooks(
+            generator.model, processors, encoder_cache=self.encoder_cache
+        ):
+            if self.speculative is not None and self.speculative.supports(generator.model, generation_kwargs):
+                outputs = []
+                for i, items in enumerate(items_list):
+                    callbacks = token_callbacks[i:i + 1] if token_callbacks else None
+                    with generation_hooks(generator.model, self._token_processors(callbacks)):
+                        outputs.append(self._speculate(generator, items, generation_kwargs))
+                return outputs
 
-        if not self.debug:
-            generation_kwargs["num_return_sequences"] = 1
             # generation_kwargs["return_full_text"] = False
             generation_kwargs["return_tensors"] = True
             generation_kwargs["return_text"] = False
+            with generation_hooks(generator.model, self._token_processors(token_callbacks, num_return_sequences)):
+                outputs = generator(
+                    items_list,
+                    **generation_kwargs,
+                )
+        outputs = [output["generated_token_ids"] for output in outputs]
+        return [
+            outputs[i * num_return_sequences:(i + 1) * num_return_sequences]
+            for i in range(len(items_list))
+        ]
 
-            generated_ids = self.generator(
-                items,
-                **generation_kwargs,
-            )[0]["generated_token_ids"]
-            recipe = self.tokenizer.decode(generated_ids, skip_special_tokens=False)
-            recipe = self._skip_special_tokens_and_prettify(recipe)
+    def _speculate(self, generator, items, generation_kwargs):
+        from transformers.tokenization_utils_base import TruncationStrategy
 
-        if self.api_ids and self.api_keys and len(self.api_ids) == len(self.api_keys):
-            test = 0
-            for i in range(len(self.api_keys)):
-                if test > self.api_test:
-                    recipe["image"] = None
-                    break
-                image = generate_cook_image(recipe["title"].lower(), self.api_ids[i], self.api_keys[i])
-                test += 1
-                if image:
-                    recipe["image"] = image
-                    break
+        # one input at a time: the accepted draft length differs per row
+        inputs = generator._parse_and_tokenize([items], truncation=TruncationStrategy.DO_NOT_TRUNCATE)
+        encoder_outputs = None
+        if self.encoder_cache is not None:
+            encoder_outputs = self.encoder_cache.encode(
+                generator.model, inputs["input_ids"], {"attention_mask": inputs["attention_mask"]}
+            )
+
+        return self.speculative.generate(
+            generator.model, inputs["input_ids"], inputs["attention_mask"], generation_kwargs, encoder_outputs
+        )
+
+    def _input_length(self, items):
+        return len(self.tokenizer(items).input_ids)
+
+    def _plan(self, items, generation_kwargs):
+        if self.length_planner is None:
+            return generation_kwargs
+
+        return self.length_planner.plan(items, generation_kwargs)
+
+    def _generate_sequences(self, items, generation_kwargs, on_token=None):
+        # `on_token` needs the tokens in this process, see `generate_stream`
+        start = time.perf_counter()
+        if self.batcher:
+            sequences = self.batcher.submit(items, generation_kwargs, on_token=on_token)
+        elif self.workers:
+            sequences = self.workers.generate([items], generation_kwargs)[0]
         else:
-            recipe["image"] = None
+            sequences = self._generate_ids([items], generation_kwargs, token_callbacks=[on_token])[0]
+
+        if self.telemetry.enabled:
+            self._observe_generation(sequences, time.perf_counter() - start)
+        return sequences
+
+    def _observe_generation(self, sequences, seconds):
+        # includes the time spent queued in the batcher or the worker pool
+        pad_token_id = self.tokenizer.pad_token_id
+        num_tokens = sum(sum(1 for token_id in ids if int(token_id) != pad_token_id) for ids in sequences)
+        self.telemetry.observe("chef_stage_seconds", seconds, stage="generate")
+        self.telemetry.observe("chef_generated_tokens", num_tokens, buckets=TOKEN_BUCKETS)
+        self.telemetry.count("chef_generated_tokens_total", num_tokens)
+        if seconds > 0:
+            self.telemetry.observe("chef_tokens_per_second", num_tokens / seconds, buckets=RATE_BUCKETS)
+
+    def _decode(self, generated_ids):
+        with self.telemetry.stage("decode"):
+            return self.parser.parse_ids(generated_ids, self.tokenizer).to_dict()
+
+    def generate_batch(self, items_list, generation_kwargs):
+        if self.debug:
+            return [
+                copy.deepcopy(self.dummy_outputs[i % len(self.dummy_outputs)]) for i in range(len(items_list))
+            ]
+
+        generation_kwargs = dict(generation_kwargs)
+        generation_kwargs["num_return_sequences"] = 1
+
+        # inputs with the same planned max_length are generated together
+        groups = OrderedDict()
+        for i, items in enumerate(items_list):
+            planned_kwargs = self._plan(items, generation_kwargs)
+            groups.setdefault(generation_key(planned_kwargs), (planned_kwargs, []))[1].append(i)
+
+        recipes = [None] * len(items_list)
+        for planned_kwargs, indices in groups.values():
+            outputs = self._generate_ids([items_list[i] for i in indices], planned_kwargs)
+            for i, generated_ids in zip(indices, outputs):
+                recipes[i] = self._decode(generated_ids[0])
+
+        return recipes
+
+    def _prefetch_food_image(self, url):
+        with self.prefetch_lock:
+            if url in self.prefetched_images:
+                return
+
+            self.prefetched_images[url] = self.executor.submit(self._download_food_image, url)
+            while len(self.prefetched_images) > 32:
+                self.prefetched_images.popitem(last=False)
+
+    def load_food_image(self, url):
+        with self.prefetch_lock:
+            future = self.prefetched_images.pop(url, None)
+
+        if future is not None:
+            return future.result()
+
+        return self._download_food_image(url)
+
+    def _download_food_image(self, url):
+        with self.telemetry.stage("image_download"):
+            image = load_image_from_url(url, rgba_mode=True)
+
+        # the shared placeholder instance, so callers can tell a failed download from a photo
+        return image if image is not None else assets.image(self.no_food)
+
+    def _is_placeholder(self, image_url, food_image):
+        # a placeholder shown for a real url is a download that failed, possibly just this once
+        return bool(image_url) and food_image is assets.image(self.no_food)
+
+    def _lookup_image(self, title, prefetch=False):
+        with self.telemetry.stage("image_lookup"):
+            image = self.image_client.lookup(title.lower()) if self.image_client else None
+        if prefetch:
+            self._prefetch_food_image(image)
+
+        return image
 
+    def _add_image(self, recipe, prefetch=False):
+        recipe["image"] = self._lookup_image(recipe["title"], prefetch=prefetch)
         return recipe
 
-    def generate_frame(self, recipe, chef_name):
-        return self.prepare_frame(recipe, chef_name)
+    def generate(self, items, generation_kwargs, prefetch_image=False):
+        recipe = self.dummy_outputs[0]
+        # recipe = self.dummy_outputs[random.randint(0, len(self.dummy_outputs) - 1)]
 
+        if self.service_url:
+            return generate_remote_recipe(self.service_url, items, generation_kwargs)
 
-@st.cache(allow_output_mutation=True)
-def load_text_generator():
+        if not self.debug:
+            generation_kwargs = dict(generation_kwargs)
+            generation_kwargs["num_return_sequences"] = 1
+            generation_kwargs = self._plan(items, generation_kwargs)
+
+            recipe = self.cache.get(items, generation_kwargs) if self.cache else None
+            if recipe is None:
+                recipe = self._decode(self._generate_sequences(items, generation_kwargs)[0])
+                if self.cache:
+                    self.cache.put(items, generation_kwargs, recipe)
+
+        return self._add_image(recipe, prefetch=prefetch_image)
+
+    def generate_variants(self, items, generation_kwargs, num_variants=3, prefetch_image=False):
+        """
+        Returns up to `num_variants` recipes with distinct titles from a single `generate` call.
+
+        The ingredients are encoded once and all sequences are decoded together: K samples for
+        sampling configs, the K best beams for beam configs. Near-identical titles are dropped,
+        so fewer than K recipes can come back.
+        """
+        generation_kwargs = dict(generation_kwargs)
+        generation_kwargs["num_return_sequences"] = 1
+
+        if self.service_url:
+            return generate_remote_variants(self.service_url, items, generation_kwargs, num_variants)
+
+        if self.debug:
+            recipes = [copy.deepcopy(recipe) for recipe in self.dummy_outputs[:num_variants]]
+        else:
+            generation_kwargs = self._plan(items, generation_kwargs)
+            recipes = self.cache.get_variants(items, generation_kwargs, num_variants) if self.cache else None
+            if recipes is None:
+                variant_kwargs = dict(generation_kwargs, num_return_sequences=num_variants)
+                num_beams = generation_kwargs.get("num_beams", 1)
+                if num_beams > 1:
+                    variant_kwargs["num_beams"] = max(num_beams, num_variants)
+
+                recipes = [self._decode(ids) for ids in self._generate_sequences(items, variant_kwargs)]
+                if self.cache:
+                    # the best beam is what a single sequence run returns, as long as the beam width is unchanged
+                    if not is_deterministic(generation_kwargs):
+                        cached = recipes
+                    else:
+                        cached = recipes[:1] if variant_kwargs.get("num_beams", 1) == num_beams else []
+
+                    for recipe in cached:
+                        self.cache.put(items, generation_kwargs, recipe)
+
+        recipes = dedupe_recipes(recipes)
+        images = [self.executor.submit(self._lookup_image, recipe["title"], prefetch_image) for recipe in recipes]
+        for recipe, image in zip(recipes, images):
+            recipe["image"] = image.result()
+
+        return recipes
+
+    def generate_stream(self, items, generation_kwargs):
+        """
+        Yields `(recipe, finished_sections, done)` while the recipe is being sampled.
+
+        Beam search only knows its best hypothesis at the end, so beam configs (and cache hits)
+        yield the complete recipe once, as does the worker pool, whose tokens stay in the workers.
+        Streamed requests still go through the batcher and share padded batches with concurrent ones.
+        The image lookup starts as soon as the title is complete and the food photo is downloaded
+        in the background, ready for `load_food_image`.
+        """
+        generation_kwargs = dict(generation_kwargs)
+        generation_kwargs["num_return_sequences"] = 1
+
+        if (
+            self.debug or self.service_url or self.workers or not self.stream
+            or generation_kwargs.get("num_beams", 1) > 1
+        ):
+            yield self.generate(items, generation_kwargs, prefetch_image=True), set(SECTIONS), True
+            return
+
+        generation_kwargs = self._plan(items, generation_kwargs)
+        recipe = self.cache.get(items, generation_kwargs) if self.cache else None
+        if recipe is not None:
+            yield self._add_image(recipe, prefetch=True), set(SECTIONS), True
+            return
+
+        tokens = queue.Queue()
+        result = {}
+        eos_token_id = self.tokenizer.eos_token_id
+
+        def observe(token_id):
+            # in a batch a finished row keeps getting padding until the longest one is done
+            result["eos"] = result.get("eos") or token_id == eos_token_id
+            if not result["eos"]:
+                tokens.put(token_id)
+
+        def run():
+            try:
+                result["ids"] = self._generate_sequences(items, generation_kwargs, on_token=observe)[0]
+            except Exception as e:
+                result["error"] = e
+            finally:
+                tokens.put(None)
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+
+        image = None
+        parser = RecipeStreamParser(self.tokenizer.all_special_tokens)
+        while True:
+            token_id = tokens.get()
+            if token_id is None:
+                break
+
+            parser.feed(self.tokenizer.convert_ids_to_tokens(token_id).replace("\u2581", " "))
+            if image is None and "title" in parser.finished:
+                image = self.executor.submit(self._lookup_image, parser.recipe["title"], True)
+
+            yield parser.recipe, parser.finished, False
+
+        worker.join()
+        if "error" in result:
+            raise result["error"]
+
+        recipe = self._decode(result["ids"])
+        if self.cache:
+            self.cache.put(items, generation_kwargs, recipe)
+
+        if image is not None and parser.recipe["title"] == recipe["title"]:
+            recipe["image"] = image.result()
+        else:
+            self._add_image(recipe, prefetch=True)
+
+        yield recipe, set(SECTIONS), True
+
+    def generate_frame(self, recipe, chef_name, food_image=None):
+        with self.telemetry.stage("render"):
+            return self.prepare_frame(recipe, chef_name, food_image)
+
+    def generate_encoded_frame(self, recipe, chef_name, food_image=None):
+        # encoded once, the same bytes are shown and downloaded
+        key = frame_key(recipe, chef_name, self.frame_encoder) if self.frame_cache else None
+        encoded = self.frame_cache.get(key) if key else None
+        if encoded is None:
+            if food_image is None:
+                food_image = self.load_food_image(recipe.get("image"))
+            frame = self.generate_frame(recipe, chef_name, food_image)
+            with self.telemetry.stage("encode_frame"):
+                encoded = self.frame_encoder.encode(frame)
+            if key and not self._is_placeholder(recipe.get("image"), food_image):
+                self.frame_cache.put(key, encoded)
+
+        return encoded
+
+    def encode_thumbnail(self, image_url, food_image):
+        key = content_key("thumbnail", image_url, self.thumbnail_encoder.settings) if self.frame_cache else None
+        encoded = self.frame_cache.get(key) if key else None
+        if encoded is None:
+            with self.telemetry.stage("encode_thumbnail"):
+                encoded = self.thumbnail_encoder.encode(food_image)
+            if key and not self._is_placeholder(image_url, food_image):
+                self.frame_cache.put(key, encoded)
+
+        return encoded
+
+
+def _load_text_generator():
     generator = TextGeneration()
     generator.load()
+    logger.info(
+        "Startup timings: %s", ", ".join(f"{k}={v:.2f}s" for k, v in generator.startup_timings.items())
+    )
+    logger.info(
+        "Memory (MB) before loading: %s; after: %s",
+        format_usage(generator.memory["before_load"]),
+        format_usage(generator.memory["after_load"]),
+    )
     return generator
 
 
+def load_text_generator():
+    import streamlit as st
+
+    return st.cache(allow_output_mutation=True)(_load_text_generator)()
+
+
 chef_top = {
     "max_length": 512,
     "min_length": 64,
@@ -181,9 +835,73 @@ chef_beam = {
     "length_penalty": 1.5,
     "num_return_sequences": 1
 }
+MAX_VARIANTS = 4
+# generation kwargs handled by `TextGeneration` itself instead of `generate`
+RECIPE_KWARGS = ("max_ingredients", "max_directions")
+CHEFS = {
+    "scheherazade": chef_top,
+    "giovanni": chef_beam,
+}
+
+
+def recipe_preview(recipe, finished, matcher):
+    preview = ["<div class='r-text-recipe'>"]
+    if "title" in finished:
+        preview += [
+            "<div class='food-title'>",
+            f"<h2 class='font-title text-bold'>{recipe['title']}</h2>",
+            "</div>",
+        ]
+
+    if recipe["ingredients"]:
+        ingredients = ext.ingredients(recipe["ingredients"], [], matcher=matcher)
+        preview += [
+            "<h3 class='ingredients font-body text-bold'>Ingredients</h3>",
+            "<ul class='ingredients-list font-body'>",
+            " ".join([f'<li>{item}</li>' for item in ingredients]),
+            "</ul>",
+        ]
+
+    if recipe["directions"]:
+        directions = ext.directions(recipe["directions"])
+        preview += [
+            "<h3 class='directions font-body text-bold'>Directions</h3>",
+            "<ol class='ingredients-list font-body'>",
+            " ".join([f'<li>{item}</li>' for item in directions]),
+            "</ol>",
+        ]
+
+    preview.append("</div>")
+    return " ".join(preview)
+
+
+def recipe_card(title, food_image, ingredients, directions):
+    return " ".join([
+        "<div class='r-text-recipe'>",
+        "<div class='food-title'>",
+        f"<img src='{food_image}' />",
+        f"<h2 class='font-title text-bold'>{title}</h2>",
+        "</div>",
+        '<div class="divider"><div class="divider-mask"></div></div>',
+        "<h3 class='ingredients font-body text-bold'>Ingredients</h3>",
+        "<ul class='ingredients-list font-body'>",
+        " ".join([f'<li>{item}</li>' for item in ingredients]),
+        "</ul>",
+        "<h3 class='directions font-body text-bold'>Directions</h3>",
+        "<ol class='ingredients-list font-body'>",
+        " ".join([f'<li>{item}</li>' for item in directions]),
+        "</ol>",
+        "</div>"
+    ])
 
 
 def main():
+    import streamlit as st
+    from utils.st import remote_css, local_css
+
+    # startup timings, memory and idle unloads go through `logger`; a no-op if logging is already set up
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
     st.set_page_config(
         page_title="Chef Transformer",
         page_icon="🍲",
@@ -213,6 +931,7 @@ def main():
 
         st.markdown(meta.CHEF_INFO, unsafe_allow_html=True)
         chef = st.selectbox("Choose your chef", index=0, options=["Chef Scheherazade", "Chef Giovanni"])
+        num_variants = st.slider("How many recipes?", min_value=1, max_value=MAX_VARIANTS, value=1)
 
         prompts = list(EXAMPLES.keys()) + ["Custom"]
         prompt = st.selectbox(
@@ -256,64 +975,67 @@ def main():
                 )
             else:
                 gen_kw = chef_top if chef == "Chef Scheherazade" else chef_beam
-                generated_recipe = generator.generate(items, gen_kw)
-
-                title = generated_recipe["title"]
-                food_image = generated_recipe["image"]
-                food_image = load_image_from_url(food_image, rgba_mode=True, default_image=generator.no_food)
-                food_image = image_to_base64(food_image)
+                matcher = ext.ingredient_matcher(pure_comma_separation(items, return_list=True))
+                if num_variants > 1:
+                    generated_recipes = generator.generate_variants(items, gen_kw, num_variants, prefetch_image=True)
+                else:
+                    preview = st.empty()
+                    for generated_recipe, finished, done in generator.generate_stream(items, gen_kw):
+                        if not done:
+                            preview.markdown(
+                                recipe_preview(generated_recipe, finished, matcher), unsafe_allow_html=True
+                            )
+                    preview.empty()
+                    generated_recipes = [generated_recipe]
 
-                ingredients = ext.ingredients(
-                    generated_recipe["ingredients"],
-                    pure_comma_separation(items, return_list=True)
-                )
-                # ingredients = [textwrap.fill(item, 10).replace("\n", "<br />   ") for item in ingredients]
-
-                directions = ext.directions(generated_recipe["directions"])
-                # directions = [textwrap.fill(item, 70).replace("\n", "<br />   ") for item in directions]
+                # the frames render in the background while the html cards are being built
+                food_images, recipe_posts = [], []
+                for generated_recipe in generated_recipes:
+                    generated_recipe["by"] = chef
+                    food_image = generator.load_food_image(generated_recipe["image"])
+                    food_images.append(food_image)
+                    recipe_posts.append(generator.executor.submit(
+                        generator.generate_encoded_frame, generated_recipe, chef.split()[-1], food_image
+                    ))
 
-                generated_recipe["by"] = chef
+                for i, (generated_recipe, food_image, recipe_post) in enumerate(
+                    zip(generated_recipes, food_images, recipe_posts)
+                ):
+                    ingredients = ext.ingredients(generated_recipe["ingredients"], [], matcher=matcher)
+                    # ingredients = [textwrap.fill(item, 10).replace("\n", "<br />   ") for item in ingredients]
 
-                r1, r2 = st.columns([6, 2])
+                    directions = ext.directions(generated_recipe["directions"])
+                    # directions = [textwrap.fill(item, 70).replace("\n", "<br />   ") for item in directions]
 
-                with r2:
-                    # st.write(st.session_state.get_random_frame)
-                    # if hasattr(st, "session_state"):
-                    #     recipe_post = generator.generate_frame(generated_recipe, st.session_state.get_random_frame)
-                    # else:
-                    #     recipe_post = generator.generate_frame(generated_recipe, get_random_frame)
+                    r1, r2 = st.columns([6, 2])
 
-                    recipe_post = generator.generate_frame(generated_recipe, chef.split()[-1])
+                    with r2:
+                        recipe_post = recipe_post.result()
+                        st.image(
+                            recipe_post.data,
+                            # width=500,
+                            caption="Save image and share on your social media",
+                            use_column_width="auto",
+                        )
+                        if hasattr(st, "download_button"):
+                            st.download_button(
+                                "Download",
+                                data=recipe_post.data,
+                                file_name=f"{generated_recipe['title'] or 'recipe'}.{recipe_post.extension}",
+                                mime=recipe_post.mime_type,
+                                key=f"download-{i}",
+                            )
 
-                    st.image(
-                        recipe_post,
-                        # width=500,
-                        caption="Save image and share on your social media",
-                        use_column_width="auto",
-                        output_format="PNG"
-                    )
-
-                with r1:
-                    st.markdown(
-                        " ".join([
-                            "<div class='r-text-recipe'>",
-                            "<div class='food-title'>",
-                            f"<img src='{food_image}' />",
-                            f"<h2 class='font-title text-bold'>{title}</h2>",
-                            "</div>",
-                            '<div class="divider"><div class="divider-mask"></div></div>',
-                            "<h3 class='ingredients font-body text-bold'>Ingredients</h3>",
-                            "<ul class='ingredients-list font-body'>",
-                            " ".join([f'<li>{item}</li>' for item in ingredients]),
-                            "</ul>",
-                            "<h3 class='directions font-body text-bold'>Directions</h3>",
-                            "<ol class='ingredients-list font-body'>",
-                            " ".join([f'<li>{item}</li>' for item in directions]),
-                            "</ol>",
-                            "</div>"
-                        ]),
-                        unsafe_allow_html=True
-                    )
+                    with r1:
+                        st.markdown(
+                            recipe_card(
+                                generated_recipe["title"],
+                                generator.encode_thumbnail(generated_recipe["image"], food_image).data_uri,
+                                ingredients,
+                                directions,
+                            ),
+                            unsafe_allow_html=True
+                        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,129 @@
+"""
+Per-frame render time of the recipe post with and without the preloaded asset registry.
+
+    python -m benchmarks.draw_assets --repeats 20
+"""
+import argparse
+import json
+import statistics
+import textwrap
+import time
+
+from PIL import Image, ImageChops, ImageDraw
+
+import dummy
+from utils.draw import assets, generate_food_with_logo_image, generate_recipe_image
+from utils.ext import ingredients as ext_ingredients, directions as ext_directions
+from utils.utils import load_image_from_local
+
+MAIN_FRAME = "asset/frame/recipe-bg.png"
+LOGO_FRAME = "asset/frame/logo.png"
+NO_FOOD = "asset/frame/no_food.png"
+CHEF_FRAMES = {
+    "scheherazade": "asset/frame/food-image-logo-bg-s.png",
+    "giovanni": "asset/frame/food-image-logo-bg-g.png",
+}
+FONTS = {
+    "title": ("asset/fonts/Poppins-Bold.ttf", 70),
+    "body_bold": ("asset/fonts/Montserrat-Bold.ttf", 22),
+    "body": ("asset/fonts/Montserrat-Regular.ttf", 18),
+}
+
+
+def uncached_render(recipe, chef_frame, fonts):
+    # the render path as it was before the registry: every layer is re-read and re-composited
+    bg = Image.open(chef_frame)
+    width, height = bg.size
+    logo = Image.open(LOGO_FRAME)
+    logo_width, logo_height = logo.size[0] // 3, logo.size[1] // 3
+    logo = logo.resize((logo_width, logo_height))
+    food = load_image_from_local(NO_FOOD).convert("RGBA").resize((300, 300))
+    bg.paste(food, (0, 0), food)
+    bg.paste(logo, (width - logo_width + 20, height - logo_height - 45), logo)
+    food_logo = bg
+
+    bg = Image.open(MAIN_FRAME)
+    bg.paste(food_logo, (50, 50), food_logo)
+    frame = Image.new("RGBA", bg.size, "#ffffff")
+    frame.paste(bg, mask=bg)
+
+    im_editable = ImageDraw.Draw(frame)
+    im_editable.text((418, 30), textwrap.fill(recipe["title"], 15).replace(" \n", "\n"), (61, 61, 70),
+                     font=fonts["title"])
+    im_editable.text((100, 450), "Ingredients", (61, 61, 70), font=fonts["body_bold"])
+    ingredients = ext_ingredients(recipe["ingredients"], [], without_mapping=True)
+    ingredients = [textwrap.fill(item, 30).replace("\n", "\n   ") for item in ingredients]
+    im_editable.text((50, 520), "\n".join([f"- {item}" for item in ingredients]), (61, 61, 70), font=fonts["body"])
+    im_editable.text((700, 450), "Directions", (61, 61, 70), font=fonts["body_bold"])
+    directions = ext_directions(recipe["directions"])
+    directions = [textwrap.fill(item, 70).replace("\n", "\n    ").capitalize() for item in directions]
+    im_editable.text(
+        (430, 520),
+        "\n".join([f"{i + 1}. {item}" for i, item in enumerate(directions)]).strip(),
+        (61, 61, 70),
+        font=fonts["body"],
+    )
+    return frame
+
+
+def cached_render(recipe, chef_frame, fonts):
+    food_logo = generate_food_with_logo_image(chef_frame, LOGO_FRAME, None, no_food=NO_FOOD)
+    return generate_recipe_image(recipe, MAIN_FRAME, food_logo, fonts, bg_color="#ffffff")
+
+
+def timeit(render, recipes, fonts, repeats):
+    timings = []
+    for _ in range(repeats):
+        for i, recipe in enumerate(recipes):
+            chef_frame = list(CHEF_FRAMES.values())[i % len(CHEF_FRAMES)]
+            start = time.perf_counter()
+            render(recipe, chef_frame, fonts)
+            timings.append(time.perf_counter() - start)
+
+    timings = sorted(timings)
+    return {
+        "p50_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[int(0.95 * (len(timings) - 1))] * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default=None, help="Optional path to save the report as JSON")
+    args = parser.parse_args()
+
+    fonts = {name: assets.font(path, size) for name, (path, size) in FONTS.items()}
+    recipes = [dict(recipe) for recipe in dummy.recipes]
+    assets.preload(
+        frame_paths=list(CHEF_FRAMES.values()) + [MAIN_FRAME],
+        logo_paths=[LOGO_FRAME],
+        background_paths=[MAIN_FRAME],
+    )
+
+    identical = all(
+        ImageChops.difference(
+            uncached_render(recipe, chef_frame, fonts), cached_render(recipe, chef_frame, fonts)
+        ).getbbox() is None
+        for recipe in recipes
+        for chef_frame in CHEF_FRAMES.values()
+    )
+
+    before = timeit(uncached_render, recipes, fonts, args.repeats)
+    after = timeit(cached_render, recipes, fonts, args.repeats)
+    report = {
+        "identical_output": identical,
+        "before": before,
+        "after": after,
+        "speedup": before["p50_ms"] / after["p50_ms"],
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Decode steps saved by the recipe-aware early stop, for both chefs, on the eval inputs.
+
+Every input is generated twice with the same seed, with and without `RecipeStopProcessor`, counting
+the decoding steps `generate` actually ran and whether the parsed recipe changed.
+
+    python -m benchmarks.early_stop --limit 50 --output early_stop.json
+    python -m benchmarks.early_stop --inputs ingredients.jsonl --field items --max-directions 8
+
+The eval prediction files are stored with git-lfs; without them (or `--inputs`) the example prompts are used.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from app import TextGeneration, chef_beam, chef_top
+from evaluate import INPUT_FIELDS
+from examples import EXAMPLES
+from utils.records import ColumnarRecords, read_rows
+from utils.utils import pure_comma_separation
+
+
+def load_inputs(path, field, limit):
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            is_pointer = f.read(40).startswith(b"version https://git-lfs")
+
+        if not is_pointer:
+            if path.endswith(".cols"):
+                with ColumnarRecords(path) as records:
+                    rows = list(records.iter_rows(stop=limit))
+            else:
+                rows = read_rows(path)
+
+            if isinstance(rows, dict):
+                rows = next(v for v in rows.values() if isinstance(v, list))
+
+            names = [field] if field else [name for name in INPUT_FIELDS if name in rows[0]]
+            if not names or names[0] not in rows[0]:
+                raise SystemExit(f"No input field in {path}, pass --field (the rows have: {', '.join(rows[0])})")
+
+            values = [row[names[0]] for row in rows[:limit]]
+            return [pure_comma_separation(v if isinstance(v, str) else ", ".join(v), return_list=False) for v in values]
+
+        print(f"{path} is a git-lfs pointer, using the example prompts")
+
+    return [pure_comma_separation(items, return_list=False) for items in EXAMPLES.values()][:limit]
+
+
+def run(generator, items, generation_kwargs, early_stop, seed):
+    from transformers import set_seed
+    from utils.generation import TokenCallbackProcessor, generation_hooks
+
+    steps = []
+    generator.early_stop = early_stop
+    set_seed(seed)
+    start = time.perf_counter()
+    with generation_hooks(generator.generator.model, [TokenCallbackProcessor(lambda input_ids: steps.append(1))]):
+        generated_ids = generator._generate_ids([items], generation_kwargs)[0][0]
+
+    return len(steps), time.perf_counter() - start, generator._decode(generated_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="Model name or path, the app's model by default")
+    parser.add_argument("--inputs", default="eval/ChefTransformer_predicted.json")
+    parser.add_argument("--field", default=None, help="Field holding the ingredients, guessed by default")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--max-ingredients", type=int, default=None)
+    parser.add_argument("--max-directions", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Save the results as JSON")
+    args = parser.parse_args()
+
+    prompts = load_inputs(args.inputs, args.field, args.limit)
+    generator = TextGeneration()
+    generator.model_name_or_path = args.model or generator.model_name_or_path
+    generator.load_pipeline()
+
+    caps = {k: v for k, v in [("max_ingredients", args.max_ingredients), ("max_directions", args.max_directions)] if v}
+    results = {"inputs": len(prompts), "caps": caps}
+    for name, generation_kwargs in [("chef_top", chef_top), ("chef_beam", chef_beam)]:
+        baseline, early, changed = [], [], 0
+        for i, items in enumerate(prompts):
+            base_steps, base_seconds, base_recipe = run(generator, items, generation_kwargs, False, args.seed + i)
+            steps, seconds, recipe = run(generator, items, dict(generation_kwargs, **caps), True, args.seed + i)
+            baseline.append((base_steps, base_seconds))
+            early.append((steps, seconds))
+            changed += recipe != base_recipe
+
+        saved = [b[0] - e[0] for b, e in zip(baseline, early)]
+        results[name] = {
+            "mean_steps": statistics.mean(b[0] for b in baseline),
+            "mean_steps_early_stop": statistics.mean(e[0] for e in early),
+            "mean_steps_saved": statistics.mean(saved),
+            "steps_saved_ratio": sum(saved) / max(1, sum(b[0] for b in baseline)),
+            "stopped_early": sum(s > 0 for s in saved),
+            "mean_seconds": statistics.mean(b[1] for b in baseline),
+            "mean_seconds_early_stop": statistics.mean(e[1] for e in early),
+            "recipes_changed": changed,
+        }
+        r = results[name]
+        print(
+            f"{name:<10} steps {r['mean_steps']:7.1f} -> {r['mean_steps_early_stop']:7.1f} "
+            f"(saved {r['mean_steps_saved']:.1f}, {r['steps_saved_ratio'] * 100:.1f}%, "
+            f"{r['stopped_early']}/{len(prompts)} stopped early)  "
+            f"latency {r['mean_seconds']:.2f}s -> {r['mean_seconds_early_stop']:.2f}s  "
+            f"recipes changed {changed}/{len(prompts)}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Size and time of encoding the rendered recipe frame and the food photo with each output setting.
+
+    python -m benchmarks.image_encoding
+    python -m benchmarks.image_encoding --photo path/to/food.jpg --repeats 20 --output encoding.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+import dummy
+from utils.encoding import ImageEncoder
+from utils.utils import image_to_base64, load_image_from_local
+
+SETTINGS = {
+    "png (legacy)": None,
+    "png level 1": dict(format="png", compress_level=1),
+    "png level 3": dict(format="png", compress_level=3),
+    "png level 6": dict(format="png", compress_level=6),
+    "png level 9": dict(format="png", compress_level=9),
+    "webp q80": dict(format="webp", quality=80),
+    "webp q90": dict(format="webp", quality=90),
+    "jpeg q85": dict(format="jpeg", quality=85),
+}
+
+
+def measure(fn, repeats):
+    timings, size = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        size = fn()
+        timings.append(time.perf_counter() - start)
+
+    return {"p50_ms": statistics.median(timings) * 1000, "bytes": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photo", default="asset/frame/food.jpg", help="Food photo used for the thumbnail rows")
+    parser.add_argument("--thumbnail-size", type=int, default=600)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default=None, help="Save the results as JSON")
+    args = parser.parse_args()
+
+    from app import TextGeneration
+
+    generator = TextGeneration()
+    generator.debug = True
+    photo = load_image_from_local(args.photo).convert("RGBA")
+    frame = generator.generate_frame(dict(dummy.recipes[0]), "scheherazade", photo)
+    targets = {"frame": (frame, None), "thumbnail": (photo, args.thumbnail_size)}
+
+    results = {}
+    for target, (image, max_size) in targets.items():
+        for name, settings in SETTINGS.items():
+            if settings is None:
+                # what the app did before: the full image as PNG at the default level, base64 included
+                fn = lambda: len(image_to_base64(image))
+            else:
+                encoder = ImageEncoder(max_size=max_size, **settings)
+                fn = lambda: len(encoder.encode(image).data_uri)
+
+            result = measure(fn, args.repeats)
+            results[f"{target}: {name}"] = result
+            print(f"{target:<10} {name:<14} {result['p50_ms']:9.2f} ms  {result['bytes'] / 1024:9.1f} KiB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Resident memory per replica for each way of loading the model.
+
+Every mode starts `--replicas` fresh processes that load the model, generate one recipe and then wait for
+each other, so `pss_mb` (the proportional share) shows how much of the weights the replicas share.
+
+    python -m benchmarks.memory --replicas 2 --output memory.json
+    python -m benchmarks.memory --modes mmap-float32 mmap-int8 --replicas 4
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+
+MODES = {
+    "from_pretrained": None,
+    "mmap-float32": "float32",
+    "mmap-bfloat16": "bfloat16",
+    "mmap-int8": "int8",
+}
+STAGES = ("before_load", "after_load", "after_generate", "all_replicas")
+
+
+def replica(mode, model, weights_path, max_length, barrier, results):
+    from app import TextGeneration, chef_top
+    from utils.memory import memory_usage
+
+    generator = TextGeneration()
+    generator.model_name_or_path = model or generator.model_name_or_path
+    generator.weights_path = weights_path
+    generator.low_memory = MODES[mode] is not None
+    generator.weights_dtype = MODES[mode] or generator.weights_dtype
+
+    usage = {"before_load": memory_usage()}
+    generator.load_pipeline()
+    usage["after_load"] = memory_usage()
+    generator.generate_batch(["beef, onion, rice, tomatoes"], dict(chef_top, max_length=max_length))
+    usage["after_generate"] = memory_usage()
+
+    barrier.wait()
+    usage["all_replicas"] = memory_usage()
+    results.put(usage)
+    # stay alive until every replica has measured
+    barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="Model name or path, the app's model by default")
+    parser.add_argument("--weights-path", default="models/safetensors")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--output", default=None, help="Save the results as JSON")
+    args = parser.parse_args()
+
+    from app import TextGeneration
+    from utils.backend import export_weights
+
+    model = args.model or TextGeneration().model_name_or_path
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for mode in args.modes:
+        if MODES[mode]:
+            # exported once up front, so the replicas do not race to write it
+            export_weights(model, args.weights_path, MODES[mode])
+
+        barrier, queue = ctx.Barrier(args.replicas), ctx.Queue()
+        processes = [
+            ctx.Process(target=replica, args=(mode, model, args.weights_path, args.max_length, barrier, queue))
+            for _ in range(args.replicas)
+        ]
+        for process in processes:
+            process.start()
+
+        usages = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        results[mode] = {
+            stage: {name: statistics.mean(u[stage].get(name, 0.0) for u in usages) for name in usages[0][stage]}
+            for stage in STAGES
+        }
+        for stage in STAGES:
+            usage = results[mode][stage]
+            print(f"{mode:<16} {stage:<15} " + "  ".join(f"{k}={v:7.1f}" for k, v in usage.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compares an ONNX Runtime backend against the PyTorch model on the example prompts.
+
+    python -m benchmarks.onnx_parity --backend onnx-int8 --repeats 3
+    python -m benchmarks.onnx_parity --model path/to/t5 --onnx-path models/onnx-local --max-length 128
+"""
+import argparse
+import json
+import statistics
+import time
+
+from app import TextGeneration, chef_beam
+from examples import EXAMPLES
+from utils.utils import pure_comma_separation
+
+CONFIGS = {
+    "greedy": {
+        "max_length": 512,
+        "min_length": 64,
+        "no_repeat_ngram_size": 3,
+        "num_beams": 1,
+        "do_sample": False,
+        "num_return_sequences": 1
+    },
+    "beam": chef_beam,
+}
+
+
+def load_generator(backend, onnx_path, model=None):
+    generator = TextGeneration()
+    generator.model_name_or_path = model or generator.model_name_or_path
+    generator.backend = backend
+    generator.onnx_path = onnx_path
+    generator.load_pipeline()
+    return generator
+
+
+def run(generator, prompts, generation_kwargs, repeats):
+    outputs, latencies = [], []
+    for items in prompts:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            generated_ids = generator._generate_ids([items], generation_kwargs)[0][0]
+            latencies.append(time.perf_counter() - start)
+
+        outputs.append([int(token_id) for token_id in generated_ids])
+
+    return outputs, latencies
+
+
+def common_prefix_ratio(reference, candidate):
+    common = 0
+    for a, b in zip(reference, candidate):
+        if a != b:
+            break
+        common += 1
+
+    return common / max(len(reference), len(candidate), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="Model name or path, the app's model by default")
+    parser.add_argument("--backend", default="onnx-int8", choices=["onnx", "onnx-int8"])
+    parser.add_argument("--onnx-path", default="models/onnx")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--max-length", type=int, default=None, help="Overrides the configs' max_length")
+    parser.add_argument("--output", default=None, help="Optional path to save the report as JSON")
+    args = parser.parse_args()
+
+    prompts = [pure_comma_separation(items, return_list=False) for items in EXAMPLES.values()]
+    reference = load_generator("pytorch", args.onnx_path, args.model)
+    candidate = load_generator(args.backend, args.onnx_path, args.model)
+
+    report = {"model": reference.model_name_or_path, "backend": args.backend, "prompts": len(prompts), "configs": {}}
+    for name in args.configs:
+        generation_kwargs = dict(CONFIGS[name])
+        if args.max_length:
+            generation_kwargs["max_length"] = args.max_length
+        # warm up both backends so the first measured call does not pay for lazy initialization
+        run(reference, prompts[:1], generation_kwargs, 1)
+        run(candidate, prompts[:1], generation_kwargs, 1)
+
+        reference_ids, reference_latencies = run(reference, prompts, generation_kwargs, args.repeats)
+        candidate_ids, candidate_latencies = run(candidate, prompts, generation_kwargs, args.repeats)
+
+        # token ids, not parsed recipes: an output without sections parses to the same empty recipe
+        exact = [a == b for a, b in zip(reference_ids, candidate_ids)]
+        same_recipe = [
+            reference._decode(a) == candidate._decode(b) for a, b in zip(reference_ids, candidate_ids)
+        ]
+        prefix = [common_prefix_ratio(a, b) for a, b in zip(reference_ids, candidate_ids)]
+        report["configs"][name] = {
+            "exact_match": sum(exact) / len(exact),
+            "same_recipe": sum(same_recipe) / len(same_recipe),
+            "common_prefix_ratio": statistics.mean(prefix),
+            "pytorch_p50_s": statistics.median(reference_latencies),
+            f"{args.backend}_p50_s": statistics.median(candidate_latencies),
+            "speedup": statistics.median(reference_latencies) / statistics.median(candidate_latencies),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Checks that utils.parser produces exactly the dict the original `_skip_special_tokens_and_prettify`
+produced, and how much faster it is.
+
+    python -m benchmarks.parser_parity
+    python -m benchmarks.parser_parity --tokenizer flax-community/t5-recipe-generation   # also checks parse_ids
+"""
+import argparse
+import re
+import sys
+import time
+
+import dummy
+from benchmarks.run import raw_recipe
+from utils.parser import T5_SPECIAL_TOKENS, RecipeParser
+
+EDGE_CASES = [
+    "",
+    "<pad> title: chicken -- rice <section> ingredients: 1 c. rice -- 2 eggs <sep> salt</s>",
+    "<pad> ingredients: a <sep> b <section> title: late title <section> directions: x <sep> <sep> y</s>",
+    "<pad> title: first <section> title: second <section> directions: one\ntitle: third</s><pad><pad>",
+    "<pad> directions: title: inside <sep> ingredients: inside too <section>ingredients:<sep></s>",
+    "<pad> title:   spaced    out   title <extra_id_0> <section> random: junk <section> <unk></s>",
+]
+
+
+def legacy_prettify(text, special_tokens):
+    # the implementation utils.parser replaces, kept verbatim for the comparison
+    recipe_maps = {"<sep>": "--", "<section>": "\n"}
+    recipe_map_pattern = "|".join(map(re.escape, recipe_maps.keys()))
+
+    text = re.sub(
+        recipe_map_pattern,
+        lambda m: recipe_maps[m.group()],
+        re.sub("|".join(special_tokens), "", text)
+    )
+
+    data = {"title": "", "ingredients": [], "directions": []}
+    for section in text.split("\n"):
+        section = section.strip()
+        if section.startswith("title:"):
+            data["title"] = " ".join(
+                [w.strip().capitalize() for w in section.replace("title:", "").strip().split() if w.strip()]
+            )
+        elif section.startswith("ingredients:"):
+            data["ingredients"] = [s.strip() for s in section.replace("ingredients:", "").split('--')]
+        elif section.startswith("directions:"):
+            data["directions"] = [s.strip() for s in section.replace("directions:", "").split('--')]
+        else:
+            pass
+
+    return data
+
+
+def timed(fn, texts, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (repeats * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokenizer", default=None, help="Tokenizer used to also check RecipeParser.parse_ids")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    special_tokens = T5_SPECIAL_TOKENS
+    tokenizer = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        special_tokens = tokenizer.all_special_tokens
+
+    recipe_parser = RecipeParser(special_tokens)
+    texts = [raw_recipe(recipe) for recipe in dummy.recipes] + EDGE_CASES
+
+    mismatches = 0
+    for text in texts:
+        expected = legacy_prettify(text, special_tokens)
+        outputs = {"parse": recipe_parser.parse(text).to_dict()}
+        if tokenizer is not None:
+            token_ids = tokenizer(text.replace("<pad>", ""), add_special_tokens=True).input_ids
+            text = tokenizer.decode(token_ids, skip_special_tokens=False)
+            expected = legacy_prettify(text, special_tokens)
+            outputs["parse"] = recipe_parser.parse(text).to_dict()
+            outputs["parse_ids"] = RecipeParser.from_tokenizer(tokenizer).parse_ids(token_ids, tokenizer).to_dict()
+
+        for name, output in outputs.items():
+            if output != expected:
+                mismatches += 1
+                print(f"[{name}] mismatch for {text!r}:\n  expected {expected}\n  got      {output}")
+
+    legacy_us = timed(lambda text: legacy_prettify(text, special_tokens), texts, args.repeats)
+    parser_us = timed(recipe_parser.parse, texts, args.repeats)
+    print(f"{len(texts)} outputs, {mismatches} mismatches")
+    print(f"legacy {legacy_us:.1f} us/recipe, parser {parser_us:.1f} us/recipe, x{legacy_us / parser_us:.2f}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Times every hot path of a recipe request separately and saves the results as JSON.
+
+    python -m benchmarks.run --output bench.json                 # full run, loads the model
+    python -m benchmarks.run --debug --output bench.json         # no model, uses dummy.recipes
+    python -m benchmarks.run --debug --compare bench.json        # fail if a stage got slower
+
+Each stage reports p50/p95/mean latency, throughput and the process peak RSS after the stage.
+"""
+import argparse
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import dummy
+from examples import EXAMPLES
+from utils import ext
+from utils.draw import generate_food_with_logo_image, generate_recipe_image
+from utils.parser import T5_SPECIAL_TOKENS
+from utils.utils import image_to_base64, load_image_from_local, pure_comma_separation
+
+# prefixes of the stages that run the model, timed with --generation-repeats
+MODEL_STAGES = ("generate:", "generate_variants:")
+
+
+def raw_recipe(recipe):
+    # the decoded model output format `_skip_special_tokens_and_prettify` expects
+    return " <section> ".join([
+        f"<pad> title: {recipe['title'].lower()}",
+        f"ingredients: {' <sep> '.join(recipe['ingredients'])}",
+        f"directions: {' <sep> '.join(recipe['directions'])}</s>",
+    ])
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def measure(fn, inputs, repeats, warmup=1):
+    for item in inputs[:warmup]:
+        fn(item)
+
+    timings = []
+    for _ in range(repeats):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            timings.append(time.perf_counter() - start)
+
+    timings = sorted(timings)
+    return {
+        "calls": len(timings),
+        "p50_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[int(0.95 * (len(timings) - 1))] * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "throughput_per_s": len(timings) / sum(timings),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def build_stages(generator, debug):
+    recipes = [dict(recipe) for recipe in dummy.recipes]
+    prompts = [pure_comma_separation(items, return_list=False) for items in EXAMPLES.values()]
+    raw = [raw_recipe(recipe) for recipe in recipes]
+    food = load_image_from_local(generator.no_food).convert("RGBA")
+    food_logo = generate_food_with_logo_image(
+        generator.chef_frames["scheherazade"], generator.logo_frame, food, no_food=generator.no_food
+    )
+
+    stages = {}
+    if not debug:
+        from app import chef_top, chef_beam
+
+        stages["generate:chef_top"] = (lambda items: generator._generate_ids([items], chef_top), prompts)
+        stages["generate:chef_beam"] = (lambda items: generator._generate_ids([items], chef_beam), prompts)
+        # compare with 3x the single sequence stages above
+        stages["generate_variants:chef_top:3"] = (
+            lambda items: generator._generate_ids([items], dict(chef_top, num_return_sequences=3)), prompts
+        )
+
+    stages["prettify"] = (generator._skip_special_tokens_and_prettify, raw)
+    stages["ext.ingredients"] = (
+        lambda recipe: ext.ingredients(recipe["ingredients"], pure_comma_separation(", ".join(recipe["ingredients"]))),
+        recipes,
+    )
+    stages["ext.directions"] = (lambda recipe: ext.directions(recipe["directions"]), recipes)
+    stages["generate_recipe_image"] = (
+        lambda recipe: generate_recipe_image(recipe, generator.main_frame, food_logo, generator.fonts),
+        recipes,
+    )
+    stages["image_to_base64"] = (image_to_base64, [food])
+    return stages
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, stage in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+
+        ratio = stage["p50_ms"] / baseline["stages"][name]["p50_ms"]
+        print(f"{name:<24} p50 {stage['p50_ms']:10.3f} ms  x{ratio:.2f} vs baseline")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--debug", action="store_true", help="Skip the model and use dummy.recipes")
+    parser.add_argument("--stages", nargs="+", default=None, help="Only run these stages")
+    parser.add_argument("--repeats", type=int, default=20, help="Passes over the inputs for the cpu stages")
+    parser.add_argument("--generation-repeats", type=int, default=1, help="Passes over the prompts for generation")
+    parser.add_argument("--output", default=None, help="Save the results as JSON")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare the p50 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before failing")
+    args = parser.parse_args()
+
+    from app import TextGeneration
+
+    generator = TextGeneration()
+    generator.debug = args.debug
+    generator.load()
+    if args.debug:
+        generator.tokenizer = SimpleNamespace(all_special_tokens=list(T5_SPECIAL_TOKENS))
+
+    results = {
+        "debug": args.debug,
+        "backend": generator.backend,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "stages": {},
+    }
+    for name, (fn, inputs) in build_stages(generator, args.debug).items():
+        if args.stages and name not in args.stages:
+            continue
+
+        repeats = args.generation_repeats if name.startswith(MODEL_STAGES) else args.repeats
+        results["stages"][name] = measure(fn, inputs, repeats)
+        stage = results["stages"][name]
+        print(
+            f"{name:<24} p50 {stage['p50_ms']:10.3f} ms  p95 {stage['p95_ms']:10.3f} ms  "
+            f"{stage['throughput_per_s']:10.2f}/s  rss {stage['peak_rss_mb']:.0f} MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressed stages: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
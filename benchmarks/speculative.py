@@ -0,0 +1,99 @@
+"""
+Latency of speculative decoding against plain `generate` on the example prompts.
+
+Every prompt is generated with both, greedy and with the chef_top sampling settings, with the same seed.
+Greedy recipes must come out identical; sampled ones only follow the same distribution, so they are not
+compared. Acceptance is the share of drafted tokens the model kept, tokens per step how many tokens
+each forward pass of the model produced.
+
+    python -m benchmarks.speculative --draft-layers 2 --draft-tokens 2 4 6
+    python -m benchmarks.speculative --draft-model models/draft --output speculative.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+from app import TextGeneration, chef_top
+from examples import EXAMPLES
+from utils.utils import pure_comma_separation
+
+CONFIGS = {
+    "greedy": dict(chef_top, do_sample=False),
+    "chef_top": chef_top,
+}
+
+
+def run(generator, items, generation_kwargs, seed):
+    from transformers import set_seed
+
+    set_seed(seed)
+    start = time.perf_counter()
+    generated_ids = generator._generate_ids([items], generation_kwargs)[0][0]
+    return time.perf_counter() - start, [int(token_id) for token_id in generated_ids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="Model name or path, the app's model by default")
+    parser.add_argument("--draft-layers", type=int, default=2, help="Decoder blocks of the truncated draft")
+    parser.add_argument("--draft-model", default=None, help="A draft from distill_draft.py instead")
+    parser.add_argument("--draft-tokens", type=int, nargs="+", default=[4])
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--max-length", type=int, default=None, help="Overrides the chef's max_length")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Save the results as JSON")
+    args = parser.parse_args()
+
+    prompts = [pure_comma_separation(items, return_list=False) for items in EXAMPLES.values()]
+    generator = TextGeneration()
+    generator.model_name_or_path = args.model or generator.model_name_or_path
+    generator.draft_layers = args.draft_layers
+    generator.draft_model = args.draft_model
+    generator.load_pipeline()
+    speculative = generator.speculative
+    draft = speculative.draft
+
+    results = {"inputs": len(prompts), "draft": args.draft_model or f"{args.draft_layers} layers"}
+    for name in args.configs:
+        generation_kwargs = dict(CONFIGS[name])
+        if args.max_length:
+            generation_kwargs["max_length"] = args.max_length
+
+        speculative.draft = None
+        baseline = [run(generator, items, generation_kwargs, args.seed + i) for i, items in enumerate(prompts)]
+        speculative.draft = draft
+        for num_draft_tokens in args.draft_tokens:
+            speculative.num_draft_tokens = num_draft_tokens
+            before = speculative.stats()
+            outputs = [run(generator, items, generation_kwargs, args.seed + i) for i, items in enumerate(prompts)]
+            after = speculative.stats()
+            drafted = after["drafted"] - before["drafted"]
+            steps = after["steps"] - before["steps"]
+
+            seconds = sum(o[0] for o in outputs)
+            base_seconds = sum(b[0] for b in baseline)
+            r = results[f"{name}/{num_draft_tokens}"] = {
+                "draft_tokens": num_draft_tokens,
+                "mean_seconds": statistics.mean(b[0] for b in baseline),
+                "mean_seconds_speculative": statistics.mean(o[0] for o in outputs),
+                "speedup": base_seconds / seconds,
+                "mean_tokens": statistics.mean(len(o[1]) for o in outputs),
+                "acceptance_rate": (after["accepted"] - before["accepted"]) / drafted if drafted else 0.0,
+                "tokens_per_step": (after["tokens"] - before["tokens"]) / steps if steps else 0.0,
+                "identical": sum(o[1] == b[1] for o, b in zip(outputs, baseline)) if name == "greedy" else None,
+            }
+            print(
+                f"{name:<9} k={num_draft_tokens}  latency {r['mean_seconds']:.2f}s -> "
+                f"{r['mean_seconds_speculative']:.2f}s ({r['speedup']:.2f}x)  "
+                f"acceptance {r['acceptance_rate'] * 100:.1f}%  {r['tokens_per_step']:.2f} tokens/step"
+                + (f"  identical {r['identical']}/{len(prompts)}" if r["identical"] is not None else "")
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
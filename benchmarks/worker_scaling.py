@@ -0,0 +1,128 @@
+"""
+Throughput of the generation worker pool for a growing number of workers.
+
+    python -m benchmarks.worker_scaling                              # 1, 2, 4, ... workers up to the core count
+    python -m benchmarks.worker_scaling --workers 1 2 4 8 --requests 64 --output scaling.json
+    python -m benchmarks.worker_scaling --debug                      # no model, synthetic cpu bound work
+
+Every worker gets `cores // workers` torch threads unless `--threads` is given. The memory
+column is the proportional set size of the parent and its workers, so shared weights are
+counted once.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dummy
+from examples import EXAMPLES
+from utils.batcher import GenerationBatcher
+from utils.utils import pure_comma_separation
+from utils.workers import WorkerPool
+
+
+def pss_mb(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+        except OSError:
+            return None
+
+    return total / 1024
+
+
+def busy_generate(cost):
+    def generate(items_list, generation_kwargs):
+        results = []
+        for i in range(len(items_list)):
+            deadline = time.process_time() + cost
+            while time.process_time() < deadline:
+                pass
+            results.append([dummy.recipes[i % len(dummy.recipes)]])
+        return results
+
+    return generate
+
+
+def run(generate_fn, num_workers, threads, prompts, args):
+    pool = WorkerPool(generate_fn, num_workers, threads)
+    pool.start()
+    batcher = GenerationBatcher(pool.generate, args.batch_size, args.batch_wait, max_in_flight=num_workers)
+    try:
+        # warm every worker up before timing
+        with ThreadPoolExecutor(num_workers) as executor:
+            list(executor.map(lambda p: batcher.submit(p, args.kwargs), prompts[:num_workers]))
+
+        requests = [prompts[i % len(prompts)] for i in range(args.requests)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            list(executor.map(lambda p: batcher.submit(p, args.kwargs), requests))
+        elapsed = time.perf_counter() - start
+
+        memory = pss_mb([os.getpid()] + [process.pid for process in pool._processes])
+    finally:
+        pool.close()
+
+    return {
+        "workers": num_workers,
+        "threads_per_worker": pool.threads_per_worker,
+        "requests": len(requests),
+        "seconds": elapsed,
+        "recipes_per_s": len(requests) / elapsed,
+        "pss_mb": memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--threads", type=int, default=None, help="Torch threads per worker")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--batch-wait-ms", type=float, default=10)
+    parser.add_argument("--chef", default="scheherazade")
+    parser.add_argument("--debug", action="store_true", help="Skip the model and burn cpu instead")
+    parser.add_argument("--debug-cost-ms", type=float, default=50, help="Cpu time per recipe with --debug")
+    parser.add_argument("--output", default=None, help="Save the report as JSON")
+    args = parser.parse_args()
+    args.batch_wait = args.batch_wait_ms / 1000
+
+    from app import CHEFS, TextGeneration
+
+    args.kwargs = dict(CHEFS[args.chef])
+    prompts = [pure_comma_separation(items, return_list=False) for items in EXAMPLES.values()]
+    if args.debug:
+        generate_fn = busy_generate(args.debug_cost_ms / 1000)
+    else:
+        generator = TextGeneration()
+        generator.load_pipeline()
+        generate_fn = generator._generate_ids
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({1} | {2 ** i for i in range(1, cores.bit_length()) if 2 ** i <= cores})
+
+    report = {"cores": cores, "debug": args.debug, "chef": args.chef, "runs": []}
+    for num_workers in workers:
+        result = run(generate_fn, num_workers, args.threads, prompts, args)
+        baseline = report["runs"][0] if report["runs"] else result
+        result["speedup"] = result["recipes_per_s"] / baseline["recipes_per_s"]
+        report["runs"].append(result)
+        memory = f"{result['pss_mb']:.0f} MB" if result["pss_mb"] is not None else "n/a"
+        print(
+            f"workers {num_workers:>3}  threads {result['threads_per_worker']:>3}  "
+            f"{result['recipes_per_s']:8.2f} recipes/s  x{result['speedup']:.2f}  pss {memory}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
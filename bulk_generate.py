@@ -0,0 +1,182 @@
+"""
+Offline recipe generation over large ingredient files.
+
+Reads ingredient lists from JSONL (one object per line, `--field` holding a comma separated
+string or a list) or CSV (`--field` column), generates them in length-sorted batches and writes
+one parsed recipe per line as JSONL. Progress is checkpointed after every chunk, so an interrupted
+run continues where it stopped when started again with the same arguments.
+
+    python bulk_generate.py ingredients.jsonl recipes.jsonl --chef giovanni --batch-size 16 --workers 4
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from itertools import islice
+
+from utils import ext
+from utils.planner import count_items
+from utils.utils import pure_comma_separation
+
+
+def read_items(input_path, field):
+    with open(input_path, newline="") as f:
+        if input_path.endswith(".csv"):
+            rows = (row.get(field, "") for row in csv.DictReader(f))
+        else:
+            rows = (json.loads(line).get(field, "") for line in f if line.strip())
+
+        for row in rows:
+            if isinstance(row, list):
+                row = ", ".join(row)
+            yield pure_comma_separation(str(row), return_list=False)
+
+
+def load_vocab(vocab_path):
+    # either one ingredient per line or the json written by `notes/Build Ingredients Vocab.ipynb`
+    with open(vocab_path) as f:
+        if not vocab_path.endswith(".json"):
+            return [line.strip() for line in f if line.strip()]
+
+        vocab = json.load(f)
+
+    if isinstance(vocab, dict):
+        vocab = [item for items in vocab.values() for item in items]
+    return vocab
+
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return {"rows": 0, "offset": 0}
+
+    with open(checkpoint_path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    with open(checkpoint_path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def sorted_batches(rows, batch_size):
+    # sorting by ingredient count (what the planned max_length depends on), then length keeps the padding small
+    rows = sorted(rows, key=lambda row: (count_items(row[1]), len(row[1])))
+    for i in range(0, len(rows), batch_size):
+        yield rows[i:i + batch_size]
+
+
+def run_shard(args, shard, num_shards, output_path):
+    if args.threads and not args.debug:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    from app import CHEFS, TextGeneration
+
+    generator = TextGeneration()
+    generator.debug = args.debug
+    if not generator.debug:
+        generator.backend = os.getenv("CHEF_BACKEND", generator.backend)
+        generator.load_pipeline()
+        generator.load_length_planner()
+
+    generation_kwargs = CHEFS[args.chef]
+    matcher = ext.ingredient_matcher(load_vocab(args.vocab)) if args.vocab else None
+    checkpoint_path = output_path + ".ckpt"
+    checkpoint = load_checkpoint(checkpoint_path)
+
+    rows = (
+        (i, items) for i, items in enumerate(read_items(args.input, args.field))
+        if i % num_shards == shard and len(items) > 1
+    )
+    rows = islice(rows, checkpoint["rows"], None)
+    generated, elapsed = 0, 0.0
+
+    with open(output_path, "a+") as output:
+        # drop anything written after the last checkpoint, it will be generated again
+        output.truncate(checkpoint["offset"])
+        output.seek(checkpoint["offset"])
+
+        while True:
+            chunk = list(islice(rows, args.chunk_size))
+            if not chunk:
+                break
+
+            start = time.perf_counter()
+            for batch in sorted_batches(chunk, args.batch_size):
+                recipes = generator.generate_batch([items for _, items in batch], generation_kwargs)
+                for (i, items), recipe in zip(batch, recipes):
+                    if matcher is not None:
+                        recipe["highlighted_ingredients"] = ext.ingredients(recipe["ingredients"], [], matcher=matcher)
+                    output.write(json.dumps({"id": i, "items": items, **recipe}) + "\n")
+
+            output.flush()
+            checkpoint["rows"] += len(chunk)
+            checkpoint["offset"] = output.tell()
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            generated += len(chunk)
+            elapsed += time.perf_counter() - start
+            print(
+                f"[shard {shard + 1}/{num_shards}] {checkpoint['rows']} recipes, "
+                f"{generated / max(elapsed, 1e-9):.2f} recipes/s",
+                file=sys.stderr,
+                flush=True,
+            )
+
+    return checkpoint["rows"], generated
+
+
+def _run_shard(job):
+    return run_shard(*job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL or CSV file with one ingredient list per row")
+    parser.add_argument("output", help="JSONL file the parsed recipes are appended to")
+    parser.add_argument("--field", default="items", help="JSON key or CSV column holding the ingredients")
+    parser.add_argument("--chef", default="giovanni", choices=["scheherazade", "giovanni"])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=512, help="Rows sorted together and checkpointed at once")
+    parser.add_argument("--workers", type=int, default=1, help="Number of generation processes")
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads per worker (default: cores / workers)")
+    parser.add_argument(
+        "--vocab",
+        default=None,
+        help="Ingredient vocabulary (txt or the vocab notebook json) to highlight in `highlighted_ingredients`",
+    )
+    parser.add_argument("--debug", action="store_true", help="Write dummy recipes without loading the model")
+    args = parser.parse_args()
+
+    if not args.threads and args.workers > 1:
+        args.threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    start = time.perf_counter()
+    if args.workers == 1:
+        results = [run_shard(args, 0, 1, args.output)]
+    else:
+        jobs = [(args, shard, args.workers, f"{args.output}.part{shard}") for shard in range(args.workers)]
+        with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+            results = pool.map(_run_shard, jobs)
+
+        with open(args.output, "w") as output:
+            for _, _, _, part_path in jobs:
+                with open(part_path) as part:
+                    shutil.copyfileobj(part, output)
+
+    elapsed = time.perf_counter() - start
+    generated = sum(generated for _, generated in results)
+    print(
+        f"Done: {sum(rows for rows, _ in results)} recipes in {args.output}, "
+        f"{generated} generated in this run at {generated / max(elapsed, 1e-9):.2f} recipes/s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
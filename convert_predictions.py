@@ -0,0 +1,52 @@
+"""
+Converts prediction JSON/JSONL files (e.g. eval/*_predicted.json) to the memory-mapped columnar format of
+utils.records, so evaluation can stream rows instead of loading the whole file.
+
+    python convert_predictions.py eval/ChefTransformer_predicted.json eval/RecipNLG_predicted.json
+    python convert_predictions.py predictions.jsonl --output predictions.cols --check
+"""
+import argparse
+import os
+import time
+
+from utils.records import ColumnarRecords, read_rows, to_columns, write_columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="JSON (list of rows or dict of columns) or JSONL files")
+    parser.add_argument("--output", default=None, help="Output path, only with a single input (default: <input>.cols)")
+    parser.add_argument("--check", action="store_true", help="Read every row back and compare it with the input")
+    args = parser.parse_args()
+
+    if args.output and len(args.inputs) > 1:
+        parser.error("--output only works with a single input")
+
+    for path in args.inputs:
+        with open(path, "rb") as f:
+            if f.read(40).startswith(b"version https://git-lfs"):
+                print(f"{path} is a git-lfs pointer, run `git lfs pull` first")
+                continue
+
+        output = args.output or os.path.splitext(path)[0] + ".cols"
+        start = time.perf_counter()
+        data = read_rows(path)
+        num_rows = write_columns(output, data)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{path} -> {output}: {num_rows} rows, {os.path.getsize(path) / 2 ** 20:.1f} MB -> "
+            f"{os.path.getsize(output) / 2 ** 20:.1f} MB in {elapsed:.1f}s"
+        )
+
+        if args.check:
+            columns = to_columns(data)
+            with ColumnarRecords(output) as records:
+                for name, values in columns.items():
+                    if list(records.column(name)) != values:
+                        raise SystemExit(f"column `{name}` differs after the round trip")
+
+            print("  round trip ok")
+
+
+if __name__ == "__main__":
+    main()
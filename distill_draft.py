@@ -0,0 +1,180 @@
+"""
+Distills a small draft model for speculative decoding (CHEF_DRAFT_MODEL) from the recipe model.
+
+The draft starts as the recipe model with only its first `--layers` decoder blocks. Those blocks and
+the final layer norm are trained to match the recipe model's next token distribution on its own
+predictions, everything else (encoder, embeddings, LM head) stays frozen, so the app can share those
+with the main model. The `--vocab-size` most frequent tokens of the predictions become the draft's
+vocabulary, which keeps its LM head small.
+
+The report shows how often the draft's top token matches the model's on held-out predictions, which
+is the acceptance rate greedy speculative decoding will see.
+
+    python distill_draft.py eval/ChefTransformer_predicted.cols --layers 2 --output models/draft
+    python distill_draft.py predictions.jsonl --input-field items --prediction-field generated --epochs 2
+"""
+import argparse
+import collections
+import copy
+import random
+import time
+
+from evaluate import INPUT_FIELDS, PREDICTION_FIELDS, as_list, pick_field
+from mine_lengths import column_names, model_text, read_columns
+from utils.utils import pure_comma_separation
+
+
+def make_pairs(columns, input_field, prediction_field, prefix):
+    pairs = []
+    for items, predictions in zip(columns[input_field], columns[prediction_field]):
+        items = pure_comma_separation(items if isinstance(items, str) else ", ".join(items), return_list=False)
+        pairs += [(prefix + items, model_text(prediction)) for prediction in as_list(predictions)]
+
+    return pairs
+
+
+def draft_vocab(tokenizer, targets, size):
+    counts = collections.Counter(token_id for ids in targets for token_id in ids)
+    vocab = {token_id for token_id, _ in counts.most_common(size)}
+    # the special tokens the parser and the stop processor look for must stay reachable
+    vocab.update(tokenizer.all_special_ids)
+    covered = sum(counts[token_id] for token_id in vocab) / max(1, sum(counts.values()))
+    return sorted(vocab), covered
+
+
+def batches(pairs, batch_size, tokenizer, max_length):
+    for start in range(0, len(pairs), batch_size):
+        inputs, targets = zip(*pairs[start:start + batch_size])
+        encoded = tokenizer(list(inputs), return_tensors="pt", padding=True)
+        labels = tokenizer(
+            list(targets), return_tensors="pt", padding=True, truncation=True, max_length=max_length
+        ).input_ids
+        yield encoded, labels
+
+
+def distill_loss(teacher, student, encoded, labels, vocab, temperature):
+    import torch
+    import torch.nn.functional as F
+
+    decoder_input_ids = teacher._shift_right(labels)
+    with torch.no_grad():
+        encoder_outputs = teacher.get_encoder()(**encoded, return_dict=True)
+        teacher_logits = teacher(
+            encoder_outputs=encoder_outputs, attention_mask=encoded.attention_mask, decoder_input_ids=decoder_input_ids
+        ).logits[..., vocab]
+
+    student_logits = student(
+        encoder_outputs=encoder_outputs, attention_mask=encoded.attention_mask, decoder_input_ids=decoder_input_ids
+    ).logits[..., vocab]
+
+    mask = labels != teacher.config.pad_token_id
+    loss = F.kl_div(
+        F.log_softmax(student_logits[mask] / temperature, dim=-1),
+        F.log_softmax(teacher_logits[mask] / temperature, dim=-1),
+        log_target=True,
+        reduction="batchmean",
+    )
+    agree = (student_logits[mask].argmax(dim=-1) == teacher_logits[mask].argmax(dim=-1)).sum().item()
+    return loss, agree, int(mask.sum())
+
+
+def evaluate_agreement(teacher, student, pairs, args, tokenizer, vocab):
+    import torch
+
+    student.eval()
+    agree = total = 0
+    with torch.no_grad():
+        for encoded, labels in batches(pairs, args.batch_size, tokenizer, args.max_length):
+            _, batch_agree, batch_total = distill_loss(teacher, student, encoded, labels, vocab, args.temperature)
+            agree += batch_agree
+            total += batch_total
+
+    student.train()
+    return agree / max(1, total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Columnar file from convert_predictions.py, JSON or JSONL")
+    parser.add_argument("--model", default="flax-community/t5-recipe-generation")
+    parser.add_argument("--output", default="models/draft")
+    parser.add_argument("--input-field", default=None)
+    parser.add_argument("--prediction-field", default=None)
+    parser.add_argument("--layers", type=int, default=2, help="Decoder blocks kept in the draft")
+    parser.add_argument("--vocab-size", type=int, default=4096, help="Tokens the draft scores, 0 for all")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--holdout", type=float, default=0.05, help="Share of the predictions kept for the report")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    names = column_names(args.input)
+    input_field = pick_field(names, INPUT_FIELDS, args.input_field, "input")
+    prediction_field = pick_field(names, PREDICTION_FIELDS, args.prediction_field, "prediction")
+    columns = read_columns(args.input, [input_field, prediction_field])
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    teacher = AutoModelForSeq2SeqLM.from_pretrained(args.model).eval()
+    pairs = make_pairs(columns, input_field, prediction_field, teacher.config.prefix or "")[:args.limit]
+    random.shuffle(pairs)
+    num_holdout = max(1, int(len(pairs) * args.holdout))
+    holdout, pairs = pairs[:num_holdout], pairs[num_holdout:]
+
+    vocab, covered = None, 1.0
+    if args.vocab_size:
+        targets = tokenizer([target for _, target in pairs], truncation=True, max_length=args.max_length).input_ids
+        vocab, covered = draft_vocab(tokenizer, targets, args.vocab_size)
+    vocab_index = torch.tensor(vocab) if vocab else slice(None)
+
+    student = copy.deepcopy(teacher)
+    student.decoder.block = student.decoder.block[:args.layers]
+    student.config.num_decoder_layers = args.layers
+    for parameter in student.parameters():
+        parameter.requires_grad = False
+    trained = list(student.decoder.block.parameters()) + list(student.decoder.final_layer_norm.parameters())
+    for parameter in trained:
+        parameter.requires_grad = True
+
+    print(
+        f"{len(pairs)} predictions for training, {len(holdout)} held out, {args.layers} decoder layers, "
+        f"vocabulary {len(vocab) if vocab else teacher.config.vocab_size} tokens covering {covered * 100:.1f}%"
+    )
+    print(f"agreement before training: {evaluate_agreement(teacher, student, holdout, args, tokenizer, vocab_index) * 100:.1f}%")
+
+    optimizer = torch.optim.AdamW(trained, lr=args.lr)
+    student.train()
+    for epoch in range(args.epochs):
+        random.shuffle(pairs)
+        start, losses = time.perf_counter(), []
+        for encoded, labels in batches(pairs, args.batch_size, tokenizer, args.max_length):
+            loss, _, _ = distill_loss(teacher, student, encoded, labels, vocab_index, args.temperature)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            losses.append(loss.item())
+
+        agreement = evaluate_agreement(teacher, student, holdout, args, tokenizer, vocab_index)
+        print(
+            f"epoch {epoch + 1}: loss {sum(losses) / max(1, len(losses)):.4f}, "
+            f"agreement {agreement * 100:.1f}%, {time.perf_counter() - start:.0f}s"
+        )
+
+    if vocab:
+        student.config.draft_vocab = vocab
+    student.eval()
+    student.save_pretrained(args.output)
+    tokenizer.save_pretrained(args.output)
+    print(f"saved to {args.output}, use it with CHEF_DRAFT_MODEL={args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Scores generated recipes against their references, per section (title, ingredients, directions and the
+whole recipe), with BLEU, ROUGE-2 and WER.
+
+Both sides are parsed like `_skip_special_tokens_and_prettify`; a field may hold the raw model text, a parsed
+recipe dict, or a list of either (several generations or references per input). BLEU is corpus level over
+every prediction and all references, ROUGE-2 and WER take the best prediction/reference pair of each row.
+Chunks of rows are scored in a process pool and merged as they finish.
+
+    python evaluate.py eval/ChefTransformer_predicted.cols --workers 8 --output report.json
+    python evaluate.py predictions.jsonl --prediction-field generated --reference-field target
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from utils.metrics import SectionStats
+from utils.parser import SECTIONS, T5_SPECIAL_TOKENS, RecipeParser
+from utils.records import ColumnarRecords, read_rows, to_columns
+
+PREDICTION_FIELDS = ("predictions", "prediction", "predicted", "generated", "generations", "outputs")
+REFERENCE_FIELDS = ("references", "reference", "targets", "target", "labels", "recipes", "recipe")
+INPUT_FIELDS = ("inputs", "input", "items", "ingredients", "ner", "NER")
+SCORED_SECTIONS = SECTIONS + ("recipe",)
+
+_parser = RecipeParser(T5_SPECIAL_TOKENS)
+_records = {}
+
+
+def recipe_sections(value):
+    recipe = value if isinstance(value, dict) else _parser.parse(str(value)).to_dict()
+    sections = {
+        "title": recipe.get("title") or "",
+        "ingredients": " ".join(recipe.get("ingredients") or []),
+        "directions": " ".join(recipe.get("directions") or []),
+    }
+    if not any(sections.values()):
+        # plain text without section markers only counts for the whole recipe
+        return {"recipe": _parser.pattern.sub(" ", str(value)).strip()}
+
+    sections["recipe"] = " ".join(sections.values())
+    return sections
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def score_rows(rows, prediction_field, reference_field):
+    stats = {section: SectionStats() for section in SCORED_SECTIONS}
+    for row in rows:
+        predictions = [recipe_sections(value) for value in as_list(row[prediction_field])]
+        references = [recipe_sections(value) for value in as_list(row[reference_field])]
+        for section, section_stats in stats.items():
+            section_stats.add(
+                [p[section] for p in predictions if section in p],
+                [r[section] for r in references if section in r],
+            )
+
+    return stats
+
+
+def score_chunk(job):
+    source, prediction_field, reference_field = job[:3]
+    if isinstance(source, str):
+        # a columnar file, each worker maps it once and reads only its own row range
+        if source not in _records:
+            _records[source] = ColumnarRecords(source)
+        start, stop = job[3:]
+        rows = _records[source].iter_rows([prediction_field, reference_field], start, stop)
+    else:
+        rows = source
+
+    return score_rows(rows, prediction_field, reference_field)
+
+
+def pick_field(names, candidates, given, kind):
+    if given:
+        if given not in names:
+            raise SystemExit(f"No `{given}` field, the input has: {', '.join(names)}")
+        return given
+
+    for name in candidates:
+        if name in names:
+            return name
+
+    raise SystemExit(f"Could not guess the {kind} field from {', '.join(names)}, pass --{kind}-field")
+
+
+def chunk_jobs(path, args):
+    if path.endswith(".cols"):
+        records = ColumnarRecords(path)
+        names, num_rows = list(records.columns), len(records)
+        records.close()
+    else:
+        columns = to_columns(read_rows(path))
+        names, num_rows = list(columns), len(next(iter(columns.values()), []))
+
+    prediction_field = pick_field(names, PREDICTION_FIELDS, args.prediction_field, "prediction")
+    reference_field = pick_field(names, REFERENCE_FIELDS, args.reference_field, "reference")
+
+    jobs = []
+    for start in range(0, num_rows, args.chunk_size):
+        stop = min(start + args.chunk_size, num_rows)
+        if path.endswith(".cols"):
+            jobs.append((path, prediction_field, reference_field, start, stop))
+        else:
+            rows = [
+                {prediction_field: columns[prediction_field][i], reference_field: columns[reference_field][i]}
+                for i in range(start, stop)
+            ]
+            jobs.append((rows, prediction_field, reference_field))
+
+    return jobs, num_rows, prediction_field, reference_field
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Columnar file from convert_predictions.py, JSON or JSONL")
+    parser.add_argument("--prediction-field", default=None)
+    parser.add_argument("--reference-field", default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=500, help="Rows per task")
+    parser.add_argument("--output", default=None, help="Save the summary as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    jobs, num_rows, prediction_field, reference_field = chunk_jobs(args.input, args)
+    totals = {section: SectionStats() for section in SCORED_SECTIONS}
+
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    results = pool.imap_unordered(score_chunk, jobs) if pool else map(score_chunk, jobs)
+    for done, stats in enumerate(results, 1):
+        for section, section_stats in stats.items():
+            totals[section].merge(section_stats)
+        print(f"\r{done}/{len(jobs)} chunks, {totals['recipe'].rows}/{num_rows} rows", end="", flush=True)
+
+    if pool:
+        pool.close()
+        pool.join()
+    print()
+
+    report = {
+        "input": args.input,
+        "prediction_field": prediction_field,
+        "reference_field": reference_field,
+        "rows": num_rows,
+        "seconds": time.perf_counter() - start,
+        "sections": {section: stats.summary() for section, stats in totals.items()},
+    }
+    for section, summary in report["sections"].items():
+        print(f"{section:<12} BLEU {summary['bleu']:.4f}  ROUGE-2 {summary['rouge2']:.4f}  WER {summary['wer']:.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Mines generated recipe lengths per ingredient count from a prediction file, for the length planner
+(utils.planner.LengthPlanner) that picks a per request `max_length`.
+
+For every ingredient count with enough rows, the `--quantile` of the generated token lengths is saved.
+The report shows how much of the fixed `max_length` budget the planned values save, and how many
+predictions would not have fit.
+
+    python mine_lengths.py eval/ChefTransformer_predicted.cols --output eval/length_stats.json
+    python mine_lengths.py predictions.jsonl --input-field items --prediction-field generated --quantile 0.995
+"""
+import argparse
+import json
+import math
+import statistics
+
+from evaluate import INPUT_FIELDS, PREDICTION_FIELDS, as_list, pick_field
+from utils.planner import LengthPlanner, count_items
+from utils.records import ColumnarRecords, read_rows, to_columns
+
+
+def model_text(value):
+    # the text the model generates, for parsed recipe dicts
+    if not isinstance(value, dict):
+        return str(value)
+
+    return " <section> ".join([
+        f"title: {(value.get('title') or '').lower()}",
+        f"ingredients: {' <sep> '.join(value.get('ingredients') or [])}",
+        f"directions: {' <sep> '.join(value.get('directions') or [])}",
+    ])
+
+
+def read_columns(path, names):
+    if path.endswith(".cols"):
+        with ColumnarRecords(path) as records:
+            return {name: list(records.column(name)) for name in names}
+
+    columns = to_columns(read_rows(path))
+    return {name: columns[name] for name in names}
+
+
+def column_names(path):
+    with open(path, "rb") as f:
+        if f.read(40).startswith(b"version https://git-lfs"):
+            raise SystemExit(f"{path} is a git-lfs pointer, run `git lfs pull` first")
+
+    if path.endswith(".cols"):
+        with ColumnarRecords(path) as records:
+            return list(records.columns)
+
+    return list(to_columns(read_rows(path)))
+
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(q * len(values)) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Columnar file from convert_predictions.py, JSON or JSONL")
+    parser.add_argument("--output", default="eval/length_stats.json")
+    parser.add_argument("--input-field", default=None)
+    parser.add_argument("--prediction-field", default=None)
+    parser.add_argument("--tokenizer", default="flax-community/t5-recipe-generation")
+    parser.add_argument("--quantile", type=float, default=0.99)
+    parser.add_argument("--min-rows", type=int, default=20, help="Skip ingredient counts with fewer rows")
+    parser.add_argument("--max-length", type=int, default=512, help="The fixed budget the plan is compared with")
+    parser.add_argument("--margin", type=float, default=0.15)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    names = column_names(args.input)
+    input_field = pick_field(names, INPUT_FIELDS, args.input_field, "input")
+    prediction_field = pick_field(names, PREDICTION_FIELDS, args.prediction_field, "prediction")
+    columns = read_columns(args.input, [input_field, prediction_field])
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+
+    by_count = {}
+    for items, predictions in zip(columns[input_field], columns[prediction_field]):
+        num_items = count_items(items)
+        for prediction in as_list(predictions):
+            # + 1 for the decoder start token, `max_length` counts it too
+            length = len(tokenizer(model_text(prediction)).input_ids) + 1
+            by_count.setdefault(num_items, []).append(length)
+
+    lengths = {
+        count: quantile(values, args.quantile) for count, values in sorted(by_count.items())
+        if len(values) >= args.min_rows
+    }
+    stats = {
+        "source": args.input,
+        "tokenizer": args.tokenizer,
+        "quantile": args.quantile,
+        "rows": {count: len(values) for count, values in sorted(by_count.items())},
+        "lengths": lengths,
+    }
+    with open(args.output, "w") as f:
+        json.dump(stats, f, indent=2)
+
+    planner = LengthPlanner(lengths, margin=args.margin)
+    planned, overflow, total = [], 0, 0
+    for count, values in sorted(by_count.items()):
+        budget = min(planner.predict(count) or args.max_length, args.max_length)
+        planned += [budget] * len(values)
+        overflow += sum(length > budget for length in values)
+        total += len(values)
+        print(f"{count:3d} items: {len(values):6d} rows, p{args.quantile * 100:g} {lengths.get(count, '-')!s:>4} tokens, plan {budget}")
+
+    print(
+        f"mean max_length {statistics.mean(planned):.0f} instead of {args.max_length}, "
+        f"{overflow}/{total} predictions longer than their plan, saved to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Headless HTTP service around TextGeneration, so one loaded model can serve many Streamlit replicas
+or any other client.
+
+    python server.py --host 0.0.0.0 --port 8080
+    CHEF_SERVICE_URL=http://localhost:8080 streamlit run app.py
+
+Endpoints:
+    GET  /healthz   -> {"status": "ok", ...} (`/health` is an alias)
+    GET  /metrics   -> Prometheus text metrics (`/metrics.json` for JSON), only with CHEF_METRICS=1
+    POST /generate  {"items": "...", "chef": "scheherazade"} or {"items": "...", "generation_kwargs": {...}}
+                    add "variants": K to get {"recipes": [...]} with up to K distinct recipes
+                    "generation_kwargs" may also hold "max_ingredients" and "max_directions" caps, see
+                    KWARG_SPECS for the accepted types and ranges
+    POST /render    same body as /generate, or {"recipe": {...}, "chef": "..."} with a recipe from /generate
+                    -> the encoded recipe frame (`image/png` unless CHEF_FRAME_FORMAT says otherwise)
+
+At most CHEF_SERVER_THREADS requests are handled at once and CHEF_SERVER_QUEUE more wait for a thread,
+anything beyond that gets a 429 with a Retry-After header.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app import CHEFS, MAX_VARIANTS, RECIPE_KWARGS, TextGeneration
+from utils.memory import memory_usage
+from utils.utils import pure_comma_separation
+
+MAX_LENGTH = 512
+MAX_BEAMS = 8
+# type and range of every generation kwarg a client may set; the ones in CLAMPED_KWARGS are clamped
+# to their range, anything else outside of it is rejected
+KWARG_SPECS = {
+    "max_length": (int, 1, MAX_LENGTH),
+    "min_length": (int, 0, MAX_LENGTH),
+    "no_repeat_ngram_size": (int, 0, MAX_LENGTH),
+    "num_beams": (int, 1, MAX_BEAMS),
+    "num_return_sequences": (int, 1, MAX_BEAMS),
+    "top_k": (int, 0, 1000),
+    "top_p": (float, 0.0, 1.0),
+    "temperature": (float, 0.01, 10.0),
+    "length_penalty": (float, -10.0, 10.0),
+    "do_sample": (bool, None, None),
+    "early_stopping": (bool, None, None),
+    "max_ingredients": (int, 1, 64),
+    "max_directions": (int, 1, 64),
+}
+CLAMPED_KWARGS = ("max_length", "min_length", "num_beams")
+ALLOWED_KWARGS = set(KWARG_SPECS)
+HEALTH_PATHS = ("/healthz", "/health")
+RECIPE_FIELDS = ("title", "ingredients", "directions")
+
+
+def resolve_kwarg(name, value):
+    kind, low, high = KWARG_SPECS[name]
+    if kind is bool:
+        if not isinstance(value, bool):
+            raise ValueError(f"`{name}` must be true or false")
+        return value
+
+    # bool is an int subclass, `true` is not a beam width
+    numbers = (int, float) if kind is float else (int,)
+    if isinstance(value, bool) or not isinstance(value, numbers):
+        raise ValueError(f"`{name}` must be {'a number' if kind is float else 'an integer'}")
+
+    value = kind(value)
+    if name in CLAMPED_KWARGS:
+        return min(max(value, low), high)
+    if not low <= value <= high:
+        raise ValueError(f"`{name}` must be between {low} and {high}")
+
+    return value
+
+
+def resolve_generation_kwargs(payload):
+    if "generation_kwargs" in payload:
+        generation_kwargs = payload["generation_kwargs"]
+        if not isinstance(generation_kwargs, dict):
+            raise ValueError("`generation_kwargs` must be an object")
+
+        unknown = set(generation_kwargs) - ALLOWED_KWARGS
+        if unknown:
+            raise ValueError(f"Unsupported generation kwargs: {', '.join(sorted(unknown))}")
+
+        generation_kwargs = {
+            name: resolve_kwarg(name, value) for name, value in generation_kwargs.items()
+            # the recipe caps fall back to the server's defaults
+            if not (name in RECIPE_KWARGS and value is None)
+        }
+        generation_kwargs.setdefault("max_length", MAX_LENGTH)
+        if "min_length" in generation_kwargs:
+            generation_kwargs["min_length"] = min(generation_kwargs["min_length"], generation_kwargs["max_length"])
+        num_beams = generation_kwargs.get("num_beams", 1)
+        if not generation_kwargs.get("do_sample") and generation_kwargs.get("num_return_sequences", 1) > num_beams:
+            raise ValueError("`num_return_sequences` can not exceed `num_beams` without sampling")
+        return generation_kwargs
+
+    return CHEFS[resolve_chef(payload)]
+
+
+def resolve_chef(payload):
+    chef = str(payload.get("chef", "scheherazade")).lower().split()[-1]
+    if chef not in CHEFS:
+        raise ValueError(f"Unknown chef `{chef}`, choose one of {', '.join(CHEFS)}")
+
+    return chef
+
+
+def _is_str_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def resolve_recipe(payload):
+    recipe = payload["recipe"]
+    if (
+        not isinstance(recipe, dict)
+        or not isinstance(recipe.get("title"), str)
+        or not all(_is_str_list(recipe.get(name)) for name in ("ingredients", "directions"))
+        or not isinstance(recipe.get("image"), (str, type(None)))
+    ):
+        raise ValueError(
+            "`recipe` must hold a `title` string and `ingredients` and `directions` lists of strings, "
+            "as returned by /generate"
+        )
+
+    return {name: recipe[name] for name in RECIPE_FIELDS + ("image",) if name in recipe}
+
+
+class RecipeHandler(BaseHTTPRequestHandler):
+    generator = None
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        telemetry = self.generator.telemetry
+        if self.path in ("/metrics", "/metrics.json"):
+            if not telemetry.enabled:
+                self._send_json(404, {"error": "metrics are disabled, start the server with CHEF_METRICS=1"})
+            elif self.path == "/metrics.json":
+                self._send_json(200, telemetry.snapshot())
+            else:
+                self._send(200, telemetry.render().encode("utf-8"), "text/plain; version=0.0.4")
+            return
+
+        if self.path not in HEALTH_PATHS:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        self._send_json(200, {
+            "status": "ok",
+            "model": self.generator.model_name_or_path,
+            "backend": self.generator.backend,
+            "debug": self.generator.debug,
+            "cache": self.generator.cache.stats() if self.generator.cache else None,
+            "encoder_cache": self.generator.encoder_cache.stats() if self.generator.encoder_cache else None,
+            "frame_cache": self.generator.frame_cache.stats() if self.generator.frame_cache else None,
+            "speculative": self.generator.speculative.stats() if self.generator.speculative else None,
+            "model_loaded": self.generator.generator is not None,
+            "memory": dict(self.generator.memory, current=memory_usage()),
+        })
+
+    def do_POST(self):
+        if self.path not in ("/generate", "/render"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        recipe = num_variants = None
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("the request body must be a JSON object")
+            if self.path == "/render":
+                chef = resolve_chef(payload)
+            if self.path == "/render" and "recipe" in payload:
+                recipe = resolve_recipe(payload)
+            else:
+                items = pure_comma_separation(str(payload.get("items", "")), return_list=False)
+                if not len(items) > 1:
+                    raise ValueError("`items` must be a comma separated list of food items")
+
+                generation_kwargs = resolve_generation_kwargs(payload)
+                num_variants = payload.get("variants") if self.path == "/generate" else None
+                if num_variants is not None:
+                    num_variants = int(num_variants)
+                    if not 1 <= num_variants <= MAX_VARIANTS:
+                        raise ValueError(f"`variants` must be between 1 and {MAX_VARIANTS}")
+        except ValueError as e:
+            self.generator.telemetry.count("chef_requests_total", status="400")
+            self._send_json(400, {"error": str(e)})
+            return
+
+        telemetry = self.generator.telemetry
+        start = time.perf_counter()
+        try:
+            if self.path == "/render":
+                if recipe is None:
+                    recipe = self.generator.generate(items, generation_kwargs)
+                food_image = self.generator.load_food_image(recipe.get("image"))
+                encoded = self.generator.generate_encoded_frame(recipe, chef, food_image)
+            elif num_variants is not None:
+                result = {"recipes": self.generator.generate_variants(items, generation_kwargs, num_variants)}
+            else:
+                result = self.generator.generate(items, generation_kwargs)
+        except Exception as e:
+            telemetry.count("chef_requests_total", status="500")
+            self._send_json(500, {"error": str(e)})
+            return
+
+        telemetry.observe("chef_stage_seconds", time.perf_counter() - start, stage="request")
+        telemetry.count("chef_requests_total", status="200")
+        if self.path == "/render":
+            self._send(200, encoded.data, encoded.mime_type)
+        else:
+            self._send_json(200, result)
+
+
+class BusyHandler(RecipeHandler):
+    """Answers a request that found the server full: health and metrics as usual, everything else with a 429."""
+
+    # runs on the accepting thread, a client that never sends its request line must not hold it up
+    timeout = 2
+    retry_after = 1
+
+    def handle_one_request(self):
+        self.close_connection = True
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except TimeoutError as e:
+            self.log_error("Request timed out: %r", e)
+            return
+        if not self.raw_requestline or not self.parse_request():
+            return
+
+        if self.command == "GET":
+            self.do_GET()
+            return
+
+        self.generator.telemetry.count("chef_requests_total", status="429")
+        body = json.dumps({"error": "server is busy, retry later"}).encode("utf-8")
+        self.send_response(429)
+        self.send_header("Retry-After", str(self.retry_after))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BoundedHTTPServer(ThreadingHTTPServer):
+    """
+    Handles requests on a fixed pool of `threads` with room for `queue_size` more waiting for a thread,
+    instead of one new thread per connection. Requests beyond that go to `BusyHandler`.
+    """
+
+    def __init__(self, server_address, handler_class, threads=8, queue_size=16):
+        super().__init__(server_address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="chef-request")
+        self.slots = threading.BoundedSemaphore(threads + queue_size)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self._reject(request, client_address)
+            return
+
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def _reject(self, request, client_address):
+        try:
+            BusyHandler(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--debug", action="store_true", help="Serve dummy recipes without loading the model")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # the service is the one doing the work, never forward to another service
+    os.environ.pop("CHEF_SERVICE_URL", None)
+
+    generator = TextGeneration()
+    generator.debug = args.debug
+    generator.load()
+
+    RecipeHandler.generator = generator
+    server = BoundedHTTPServer(
+        (args.host, args.port),
+        RecipeHandler,
+        threads=max(1, int(os.getenv("CHEF_SERVER_THREADS", 8))),
+        queue_size=max(0, int(os.getenv("CHEF_SERVER_QUEUE", 16))),
+    )
+    print(f"Serving {generator.model_name_or_path} on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from utils.api import ImageLookupClient
+
+IMAGE_URL = "https://example.com/soup.jpg"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers like Edamam, how depends on the app id."""
+
+    def do_GET(self):
+        app_id = parse_qs(urlparse(self.path).query)["app_id"][0]
+        if app_id == "slow":
+            time.sleep(1)
+        if app_id == "limited":
+            self._send(429, b"{}", {"Retry-After": "30"})
+        elif app_id == "down":
+            self._send(500, b"{}")
+        elif app_id == "broken":
+            self._send(200, b"<html>not json</html>")
+        elif app_id == "odd":
+            self._send(200, json.dumps({"hits": ["soup"]}).encode("utf-8"))
+        else:
+            self._send(200, json.dumps({"hits": [{"recipe": {"image": IMAGE_URL}}]}).encode("utf-8"))
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/recipes/v2"
+    server.shutdown()
+    server.server_close()
+
+
+def client(stub_url, app_ids):
+    return ImageLookupClient(
+        app_ids, ["key"] * len(app_ids), base_url=stub_url, timeout=(1, 0.3), max_attempts=len(app_ids)
+    )
+
+
+def test_failing_pairs_fall_back_to_a_working_one(stub_url):
+    lookup = client(stub_url, ["limited", "down", "broken", "odd", "slow", "ok"])
+    assert lookup.lookup("soup") == IMAGE_URL
+    assert lookup._blocked_until["limited"] > time.monotonic()
+
+
+def test_failures_only_are_not_cached(stub_url):
+    lookup = client(stub_url, ["limited", "broken", "slow"])
+    assert lookup.lookup("soup") is None
+    assert lookup._cache_get("soup") == (None, False)
+
+
+def test_answer_without_image_is_cached(stub_url):
+    lookup = client(stub_url, ["down", "odd"])
+    assert lookup.lookup("soup") is None
+    assert lookup._cache_get("soup") == (None, True)
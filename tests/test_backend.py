@@ -0,0 +1,73 @@
+import json
+import struct
+
+import pytest
+import torch
+
+from utils.backend import SAFETENSORS_DTYPES, load_safetensors, save_safetensors
+
+
+@pytest.fixture
+def state_dict():
+    shared = torch.randn(5, 3)
+    return {
+        "encoder.embed": shared,
+        "decoder.embed": shared,
+        "odd": torch.randn(3),
+        "half": torch.randn(7).to(torch.float16),
+        "positions": torch.arange(5),
+        "mask": torch.tensor([True, False, True]),
+        "empty": torch.zeros(0, 4),
+    }
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    (header_size,) = struct.unpack_from("<Q", data)
+    header = json.loads(data[8:8 + header_size])
+    return header_size, header, len(data) - 8 - header_size
+
+
+def test_offsets_follow_the_spec(tmp_path, state_dict):
+    path = tmp_path / "model.safetensors"
+    save_safetensors(path, state_dict, {"format": "pt"})
+    header_size, header, data_size = read_header(path)
+    metadata = header.pop("__metadata__")
+
+    assert header_size % 8 == 0
+    assert all(isinstance(value, str) for value in metadata.values())
+    # contiguous, no gaps and no trailing bytes
+    offsets = sorted(info["data_offsets"] for info in header.values())
+    assert offsets[0][0] == 0
+    assert all(previous[1] == current[0] for previous, current in zip(offsets, offsets[1:]))
+    assert offsets[-1][1] == data_size
+    for info in header.values():
+        itemsize = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]]).itemsize
+        start, end = info["data_offsets"]
+        assert end - start == itemsize * torch.Size(info["shape"]).numel()
+        assert (8 + header_size + start) % itemsize == 0
+
+
+def test_round_trip(tmp_path, state_dict):
+    path = tmp_path / "model.safetensors"
+    save_safetensors(path, state_dict)
+    tensors = load_safetensors(path)
+
+    assert set(tensors) == set(state_dict)
+    for name, tensor in state_dict.items():
+        assert tensors[name].dtype == tensor.dtype
+        assert torch.equal(tensors[name], tensor)
+    assert tensors["decoder.embed"] is tensors["encoder.embed"]
+
+
+def test_official_loader_reads_the_file(tmp_path, state_dict):
+    safetensors_torch = pytest.importorskip("safetensors.torch")
+    path = tmp_path / "model.safetensors"
+    save_safetensors(path, state_dict)
+    tensors = safetensors_torch.load_file(str(path))
+
+    assert set(tensors) == set(state_dict) - {"decoder.embed"}
+    for name, tensor in tensors.items():
+        assert torch.equal(tensor, state_dict[name])
@@ -0,0 +1,44 @@
+import pytest
+from PIL import Image
+
+import app
+import dummy
+from app import TextGeneration
+
+PHOTO_URL = "https://example.com/photo.jpg"
+
+
+@pytest.fixture
+def generator(monkeypatch, tmp_path):
+    monkeypatch.setenv("CHEF_FRAME_CACHE_DIR", str(tmp_path))
+    generator = TextGeneration()
+    generator.debug = True
+    generator.load()
+    return generator
+
+
+@pytest.fixture
+def recipe():
+    return dict(dummy.recipes[0], image=PHOTO_URL)
+
+
+def test_placeholder_frames_are_not_cached(generator, recipe, monkeypatch):
+    monkeypatch.setattr(app, "load_image_from_url", lambda url, **kwargs: None)
+    food_image = generator.load_food_image(PHOTO_URL)
+    generator.generate_encoded_frame(recipe, "giovanni", food_image)
+    generator.encode_thumbnail(PHOTO_URL, food_image)
+
+    stats = generator.frame_cache.stats()
+    assert stats["entries"] == 0
+    assert stats["disk_entries"] == 0
+
+
+def test_downloaded_frames_are_cached(generator, recipe, monkeypatch):
+    monkeypatch.setattr(app, "load_image_from_url", lambda url, **kwargs: Image.new("RGBA", (64, 64), "#aa3300"))
+    food_image = generator.load_food_image(PHOTO_URL)
+    generator.generate_encoded_frame(recipe, "giovanni", food_image)
+    generator.encode_thumbnail(PHOTO_URL, food_image)
+
+    stats = generator.frame_cache.stats()
+    assert stats["entries"] == 2
+    assert stats["disk_entries"] == 2
@@ -0,0 +1,38 @@
+import torch
+from transformers import LogitsProcessorList, MinLengthLogitsProcessor
+
+from utils.generation import RecipeStopProcessor
+
+EOS, SECTION, SEP = 1, 5, 6
+VOCAB = 8
+
+
+def directions_ids(length):
+    # title <section> ingredients <section> directions, padded with a regular token up to `length`
+    ids = [0, 7, SECTION, 7, SEP, 7, SECTION, 7]
+    return torch.tensor([ids + [7] * (length - len(ids))])
+
+
+def processors(min_length, **kwargs):
+    return LogitsProcessorList([
+        MinLengthLogitsProcessor(min_length, EOS),
+        RecipeStopProcessor(EOS, SECTION, SEP, **kwargs),
+    ])
+
+
+def test_min_length_keeps_eos_blocked():
+    scores = processors(64)(directions_ids(10), torch.zeros(1, VOCAB))
+    assert scores[0, EOS] == -float("inf")
+    assert scores[0, SECTION] == 0.0
+
+
+def test_section_routed_to_eos_after_min_length():
+    scores = processors(64)(directions_ids(64), torch.zeros(1, VOCAB))
+    assert scores[0, SECTION] == -float("inf")
+    assert torch.isclose(scores[0, EOS], torch.log(torch.tensor(2.0)))
+
+
+def test_max_directions_respects_min_length():
+    scores = processors(64, max_directions=1)(directions_ids(10), torch.zeros(1, VOCAB))
+    assert scores[0, EOS] == -float("inf")
+    assert scores[0, SEP] == 0.0
@@ -0,0 +1,25 @@
+import pytest
+
+import dummy
+from benchmarks.parser_parity import EDGE_CASES, legacy_prettify
+from benchmarks.run import raw_recipe
+from utils.parser import T5_SPECIAL_TOKENS, RecipeParser
+
+TEXTS = [raw_recipe(recipe) for recipe in dummy.recipes] + EDGE_CASES
+
+
+@pytest.fixture(scope="module")
+def recipe_parser():
+    return RecipeParser(T5_SPECIAL_TOKENS)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_parse_matches_legacy_prettify(recipe_parser, text):
+    assert recipe_parser.parse(text).to_dict() == legacy_prettify(text, T5_SPECIAL_TOKENS)
+
+
+def test_dummy_recipes_round_trip(recipe_parser):
+    for recipe in dummy.recipes:
+        parsed = recipe_parser.parse(raw_recipe(recipe))
+        assert parsed.ingredients == recipe["ingredients"]
+        assert parsed.directions == recipe["directions"]
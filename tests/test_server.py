@@ -0,0 +1,81 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from app import TextGeneration
+from server import MAX_BEAMS, MAX_LENGTH, BoundedHTTPServer, RecipeHandler, resolve_generation_kwargs
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    generator = TextGeneration()
+    generator.debug = True
+    generator.load()
+
+    RecipeHandler.generator = generator
+    server = BoundedHTTPServer(("127.0.0.1", 0), RecipeHandler, threads=2, queue_size=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def post(base_url, path, payload):
+    request = urllib.request.Request(base_url + path, data=json.dumps(payload).encode("utf-8"), method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, response.headers["Content-Type"], response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers["Content-Type"], e.read()
+
+
+def test_generate_then_render(base_url):
+    status, _, body = post(base_url, "/generate", {"items": "beef, onion, rice", "chef": "giovanni"})
+    assert status == 200
+    recipe = json.loads(body)
+
+    status, content_type, body = post(base_url, "/render", {"recipe": recipe, "chef": "giovanni"})
+    assert status == 200
+    assert content_type == "image/png"
+    assert body.startswith(b"\x89PNG")
+
+
+@pytest.mark.parametrize("recipe", [
+    {"title": "soup", "ingredients": "1 onion", "directions": ["boil."]},
+    {"title": "soup", "ingredients": ["1 onion", 2], "directions": ["boil."]},
+    {"title": 3, "ingredients": [], "directions": []},
+    ["soup"],
+])
+def test_render_rejects_malformed_recipes(base_url, recipe):
+    status, _, _ = post(base_url, "/render", {"recipe": recipe})
+    assert status == 400
+
+
+def test_generation_kwargs_are_clamped():
+    generation_kwargs = resolve_generation_kwargs({"generation_kwargs": {
+        "max_length": 4096, "min_length": 10000, "num_beams": 1000, "max_ingredients": None,
+    }})
+    assert generation_kwargs == {"max_length": MAX_LENGTH, "min_length": MAX_LENGTH, "num_beams": MAX_BEAMS}
+
+
+@pytest.mark.parametrize("generation_kwargs", [
+    {"num_beams": "5"},
+    {"num_beams": True},
+    {"top_p": 1.5},
+    {"top_k": -1},
+    {"temperature": 0},
+    {"do_sample": 1},
+    {"num_return_sequences": 3},
+    {"seed": 1},
+    ["max_length"],
+])
+def test_bad_generation_kwargs_are_rejected(base_url, generation_kwargs):
+    with pytest.raises(ValueError):
+        resolve_generation_kwargs({"generation_kwargs": generation_kwargs})
+
+    status, _, _ = post(base_url, "/generate", {"items": "beef, onion", "generation_kwargs": generation_kwargs})
+    assert status == 400
@@ -1,26 +1,182 @@
+import logging
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+from requests.adapters import HTTPAdapter
+
+EDAMAM_API_URL = "https://api.edamam.com/api/recipes/v2"
+
+logger = logging.getLogger(__name__)
+
+
+def _pick_image(rj):
+    if not isinstance(rj, dict) or not isinstance(rj.get("hits"), list) or not len(rj["hits"]) > 0:
+        return None
+
+    data = rj["hits"]
+    data = data[random.randint(1, min(5, len(data) - 1))] if len(data) > 1 else data[0]
+
+    if not isinstance(data, dict) or not isinstance(data.get("recipe"), dict) or "image" not in data["recipe"]:
+        return None
+
+    return data["recipe"]["image"]
 
 
 def generate_cook_image(query, app_id, app_key):
-    api_url = f"https://api.edamam.com/api/recipes/v2?type=public&q={query}&app_id={app_id}&app_key={app_key}&field=image"
+    api_url = f"{EDAMAM_API_URL}?type=public&q={query}&app_id={app_id}&app_key={app_key}&field=image"
 
     try:
         r = requests.get(api_url)
         if r.status_code != 200:
             return None
 
-        rj = r.json()
-        if "hits" not in rj or not len(rj["hits"]) > 0:
+        return _pick_image(r.json())
+    except (requests.RequestException, ValueError) as e:
+        logger.debug("Image lookup for %r failed: %s", query, e)
+        return None
+
+
+def generate_remote_recipe(service_url, items, generation_kwargs, timeout=120):
+    r = requests.post(
+        f"{service_url.rstrip('/')}/generate",
+        json={"items": items, "generation_kwargs": generation_kwargs},
+        timeout=timeout,
+    )
+    r.raise_for_status()
+    return r.json()
+
+
+def generate_remote_variants(service_url, items, generation_kwargs, num_variants, timeout=120):
+    r = requests.post(
+        f"{service_url.rstrip('/')}/generate",
+        json={"items": items, "generation_kwargs": generation_kwargs, "variants": num_variants},
+        timeout=timeout,
+    )
+    r.raise_for_status()
+    return r.json()["recipes"]
+
+
+class RateLimitedError(Exception):
+    pass
+
+
+class ImageLookupClient:
+    """
+    Edamam image lookup shared by all requests.
+
+    One pooled session with hard timeouts, a per-title TTL cache, and a concurrent fan-out over
+    at most `max_attempts` credential pairs where the first image found wins. Pairs answered
+    with HTTP 429, or that used up `calls_per_minute`, are skipped until their window resets.
+    """
+
+    def __init__(
+            self,
+            app_ids,
+            app_keys,
+            base_url=EDAMAM_API_URL,
+            timeout=(2, 5),
+            max_attempts=3,
+            calls_per_minute=10,
+            cache_size=1024,
+            cache_ttl=3600,
+    ):
+        self.credentials = list(zip(app_ids, app_keys))
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.calls_per_minute = calls_per_minute
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, len(self.credentials)))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.credentials)))
+
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._calls = {app_id: [] for app_id, _ in self.credentials}
+        self._blocked_until = {app_id: 0.0 for app_id, _ in self.credentials}
+
+    def _available(self):
+        now = time.monotonic()
+        available = []
+        with self._lock:
+            for app_id, app_key in self.credentials:
+                calls = [t for t in self._calls[app_id] if now - t < 60]
+                self._calls[app_id] = calls
+                if self._blocked_until[app_id] > now:
+                    continue
+                if self.calls_per_minute and len(calls) >= self.calls_per_minute:
+                    continue
+                available.append((app_id, app_key))
+
+        random.shuffle(available)
+        return available[:self.max_attempts]
+
+    def _fetch(self, query, app_id, app_key):
+        with self._lock:
+            self._calls[app_id].append(time.monotonic())
+
+        r = self.session.get(
+            self.base_url,
+            params={"type": "public", "q": query, "app_id": app_id, "app_key": app_key, "field": "image"},
+            timeout=self.timeout,
+        )
+        if r.status_code == 429:
+            retry_after = r.headers.get("Retry-After", "60")
+            with self._lock:
+                self._blocked_until[app_id] = time.monotonic() + (float(retry_after) if retry_after.isdigit() else 60)
+            raise RateLimitedError(app_id)
+
+        if r.status_code != 200:
             return None
 
-        data = rj["hits"]
-        data = data[random.randint(1, min(5, len(data) - 1))] if len(data) > 1 else data[0]
+        return _pick_image(r.json())
+
+    def _cache_get(self, query):
+        with self._lock:
+            entry = self._cache.get(query)
+            if entry is None or time.monotonic() - entry[0] > self.cache_ttl:
+                return None, False
+            return entry[1], True
+
+    def _cache_set(self, query, image):
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                del self._cache[min(self._cache, key=lambda k: self._cache[k][0])]
+            self._cache[query] = (time.monotonic(), image)
+
+    def lookup(self, query):
+        image, found = self._cache_get(query)
+        if found:
+            return image
 
-        if "recipe" not in data or "image" not in data["recipe"]:
+        futures = {
+            self._executor.submit(self._fetch, query, app_id, app_key): app_id for app_id, app_key in self._available()
+        }
+        if not futures:
             return None
 
-        image = data["recipe"]["image"]
+        image, answered = None, False
+        for future in as_completed(futures):
+            try:
+                image = future.result()
+                answered = True
+            except (RateLimitedError, requests.RequestException, ValueError) as e:
+                # the next pair may still answer
+                logger.debug("Image lookup for %r with %s failed: %r", query, futures[future], e)
+                continue
+
+            if image:
+                break
+
+        # only remember answers, not timeouts or rate limits
+        if answered:
+            self._cache_set(query, image)
+
         return image
-    except Exception as e:
-        return None
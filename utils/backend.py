@@ -0,0 +1,274 @@
+import functools
+import inspect
+import json
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from pathlib import Path
+
+BACKENDS = ("pytorch", "onnx", "onnx-int8")
+WEIGHT_DTYPES = ("float32", "bfloat16", "int8")
+# safetensors dtype names, see https://github.com/huggingface/safetensors
+SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+_HEADER_SIZE = struct.Struct("<Q")
+
+
+def load_onnx_model(model_name_or_path, onnx_path, quantized=True):
+    try:
+        from fastT5 import generate_onnx_representation, get_onnx_model
+        from fastT5.onnx_exporter import get_model_paths
+    except ImportError:
+        raise ImportError(
+            "The onnx backends require fastT5 and onnxruntime, run `pip install -r requirements-onnx.txt`."
+        )
+
+    # the encoder, the first decoder step and the decoder with past-key-values are exported once
+    model_paths = get_model_paths(model_name_or_path, Path(onnx_path), quantized)
+    if not all(path.exists() for path in model_paths):
+        with _legacy_onnx_export():
+            model_paths = generate_onnx_representation(model_name_or_path, output_path=onnx_path)
+        if quantized:
+            _quantize_onnx(model_paths)
+
+    return get_onnx_model(model_name_or_path, onnx_path, quantized=quantized)
+
+
+def _quantize_onnx(model_paths):
+    # fastT5's own `quantize` passes arguments newer onnxruntime releases removed; dynamic quantization
+    # always uses uint8 activations, so this writes the same `-quantized.onnx` files
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for path in model_paths:
+        path = Path(path).as_posix()
+        quantize_dynamic(
+            model_input=path,
+            model_output=f"{path[:-len('.onnx')]}-quantized.onnx",
+            per_channel=True,
+            reduce_range=True,
+            weight_type=QuantType.QInt8,
+        )
+
+
+def onnx_pipeline(model, tokenizer):
+    """A text2text pipeline around the fastT5 model, which the pipeline's supported model check rejects."""
+    from transformers import Text2TextGenerationPipeline
+
+    class OnnxText2TextGenerationPipeline(Text2TextGenerationPipeline):
+        def check_model_type(self, supported_models):
+            # `OnnxT5` subclasses T5ForConditionalGeneration but is not in the model mapping
+            pass
+
+    return OnnxText2TextGenerationPipeline(model=model, tokenizer=tokenizer, framework="pt")
+
+
+@contextmanager
+def _legacy_onnx_export():
+    # fastT5 passes `dynamic_axes`, which the dynamo exporter (the default since torch 2.9) rejects
+    import torch
+
+    export = torch.onnx.export
+    if "dynamo" not in inspect.signature(export).parameters:
+        yield
+        return
+
+    torch.onnx.export = functools.partial(export, dynamo=False)
+    try:
+        yield
+    finally:
+        torch.onnx.export = export
+
+
+def save_snapshot(path, model, tokenizer):
+    import torch
+
+    # pickles the instantiated objects, loading them back skips hub resolution and config parsing
+    torch.save({"model": model, "tokenizer": tokenizer}, path)
+
+
+def load_snapshot(path):
+    """
+    Loads a `save_snapshot` file. It holds pickled objects rather than plain tensors, so it can not be loaded
+    with `weights_only=True` and unpickling runs arbitrary code: only load snapshots this app wrote to a
+    path no one else can write to.
+    """
+    import torch
+
+    try:
+        snapshot = torch.load(path, weights_only=False)
+    except TypeError:
+        # torch < 1.13 has no `weights_only` and always unpickles everything
+        snapshot = torch.load(path)
+
+    return snapshot["model"], snapshot["tokenizer"]
+
+
+def save_safetensors(path, state_dict, metadata=None):
+    """
+    Writes `state_dict` as a safetensors file, tied tensors once (their other names go to the metadata).
+
+    The tensors are stored back to back as the format requires, widest dtype first, so with the header
+    padded to 8 bytes every tensor is still aligned to its element size and `load_safetensors` can map
+    all of them in place.
+    """
+    import torch
+
+    names = {dtype: name for name, dtype in SAFETENSORS_DTYPES.items()}
+    tensors, aliases, seen = [], {}, {}
+    for name, tensor in state_dict.items():
+        key = (tensor.data_ptr(), tensor.dtype, tuple(tensor.shape))
+        if tensor.numel() and key in seen:
+            aliases[name] = seen[key]
+            continue
+
+        seen[key] = name
+        tensors.append((name, tensor))
+
+    header, blobs, offset = {}, [], 0
+    for name, tensor in sorted(tensors, key=lambda item: -item[1].element_size()):
+        data = tensor.detach().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes() if tensor.numel() else b""
+        header[name] = {
+            "dtype": names[str(tensor.dtype).replace("torch.", "")],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + len(data)],
+        }
+        blobs.append(data)
+        offset += len(data)
+
+    header["__metadata__"] = dict(metadata or {}, aliases=json.dumps(aliases))
+    encoded = json.dumps(header).encode("utf-8")
+    encoded += b" " * (-len(encoded) % 8)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER_SIZE.pack(len(encoded)))
+        f.write(encoded)
+        for blob in blobs:
+            f.write(blob)
+
+    os.replace(tmp, path)
+
+
+def load_safetensors(path):
+    """
+    Maps a safetensors file and returns its tensors without copying them.
+
+    The mapping is private (copy on write), so the weights live in the page cache and are shared by
+    every process that maps the same file until one of them writes to a tensor.
+    """
+    return _map_safetensors(path)[0]
+
+
+def _map_safetensors(path):
+    import torch
+
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_size = _HEADER_SIZE.unpack_from(buffer, 0)[0]
+    header = json.loads(bytes(buffer[_HEADER_SIZE.size:_HEADER_SIZE.size + header_size]))
+    metadata = header.pop("__metadata__", None) or {}
+    base = _HEADER_SIZE.size + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        if start == end:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+
+        tensor = torch.frombuffer(buffer, dtype=torch.uint8, count=end - start, offset=base + start)
+        if (base + start) % dtype.itemsize:
+            # files from other writers may leave a tensor unaligned, that one gets its own copy
+            tensor = tensor.clone()
+        tensors[name] = tensor.view(dtype).reshape(info["shape"])
+
+    for alias, name in json.loads(metadata.get("aliases", "{}")).items():
+        tensors[alias] = tensors[name]
+
+    return tensors, buffer
+
+
+def _enable_bfloat16(model):
+    """transformers 4.9 only knows float16/float32 models, these two spots are all a bfloat16 T5 needs."""
+    import torch
+    from transformers.models.t5.modeling_t5 import T5LayerNorm, T5Stack
+
+    def invert_attention_mask(mask):
+        mask = mask[:, None, None, :] if mask.dim() == 2 else mask[:, None, :, :]
+        return (1.0 - mask.to(torch.bfloat16)) * -1e9
+
+    for module in model.modules():
+        if isinstance(module, T5LayerNorm):
+            # computed in float32 and only cast back for float16, the next linear needs bfloat16
+            module.register_forward_hook(lambda module, inputs, output: output.to(torch.bfloat16))
+        elif isinstance(module, T5Stack):
+            module.invert_attention_mask = invert_attention_mask
+
+
+def export_weights(model_name_or_path, weights_path, dtype="float32"):
+    """Saves config, tokenizer and (`dtype` converted) weights to `weights_path` once, from the hub checkpoint."""
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    os.makedirs(weights_path, exist_ok=True)
+    # int8 is quantized after loading, from the float32 weights
+    file_dtype = "float32" if dtype == "int8" else dtype
+    weights_file = os.path.join(weights_path, f"model-{file_dtype}.safetensors")
+    if os.path.exists(weights_file):
+        return weights_file
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name_or_path)
+    model.config.save_pretrained(weights_path)
+    AutoTokenizer.from_pretrained(model_name_or_path).save_pretrained(weights_path)
+    state_dict, converted = {}, {}
+    for name, tensor in model.state_dict().items():
+        if tensor.is_floating_point():
+            # converted once per storage, so tied weights stay tied in the file
+            if tensor.data_ptr() not in converted:
+                converted[tensor.data_ptr()] = tensor.to(getattr(torch, file_dtype))
+            tensor = converted[tensor.data_ptr()]
+        state_dict[name] = tensor
+    save_safetensors(weights_file, state_dict, {"format": "pt", "source": str(model_name_or_path)})
+    return weights_file
+
+
+def load_mmap_model(model_name_or_path, weights_path, dtype="float32"):
+    """
+    Low memory loading: the model is built without allocating weights and its parameters are pointed
+    at the memory-mapped safetensors export (written on first use), optionally held in bfloat16 or
+    dynamically quantized to int8.
+    """
+    import inspect
+
+    import torch
+    from transformers import AutoConfig, AutoModelForSeq2SeqLM, AutoTokenizer
+
+    if dtype not in WEIGHT_DTYPES:
+        raise ValueError(f"Unknown weights dtype `{dtype}`, choose one of {', '.join(WEIGHT_DTYPES)}")
+    if "assign" not in inspect.signature(torch.nn.Module.load_state_dict).parameters:
+        raise RuntimeError("Memory-mapped loading needs torch >= 2.1")
+
+    weights_file = export_weights(model_name_or_path, weights_path, dtype)
+    config = AutoConfig.from_pretrained(weights_path)
+    with torch.device("meta"):
+        model = AutoModelForSeq2SeqLM.from_config(config)
+
+    state_dict, buffer = _map_safetensors(weights_file)
+    model.load_state_dict(state_dict, strict=True, assign=True)
+    del state_dict
+    model.tie_weights()
+    model.eval()
+    if dtype == "bfloat16":
+        _enable_bfloat16(model)
+    elif dtype == "int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        # quantizing read every float32 linear weight, let those pages go; the embeddings fault back in
+        if hasattr(mmap, "MADV_DONTNEED"):
+            buffer.madvise(mmap.MADV_DONTNEED)
+
+    return model, AutoTokenizer.from_pretrained(weights_path)
@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+def generation_key(generation_kwargs):
+    return tuple(sorted(generation_kwargs.items()))
+
+
+class _Request:
+    def __init__(self, items, generation_kwargs, bucket=None, on_token=None):
+        self.items = items
+        self.generation_kwargs = generation_kwargs
+        self.on_token = on_token
+        self.key = (generation_key(generation_kwargs), bucket)
+        self.arrived = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GenerationBatcher:
+    """
+    Coalesces concurrent `submit` calls into padded batches.
+
+    Requests wait at most `max_wait` seconds for companions and only requests with identical
+    generation kwargs share a batch, so sampling and beam configs never get mixed.
+    `generate_fn(items_list, generation_kwargs)` must return one result per input.
+    With `max_in_flight > 1` up to that many batches run at once, e.g. one per pool worker; the
+    next batch is only formed when a slot frees up, so it collects everything queued meanwhile.
+    With a `length_fn` (e.g. the tokenized input length) requests are also bucketed by
+    `length_fn(items) // bucket_width`, so short prompts are not padded up to long ones.
+    Requests submitted with `on_token` (streamed ones) get each of their tokens as it is decoded;
+    batches holding one are run as `generate_fn(items_list, generation_kwargs, token_callbacks=...)`.
+    """
+
+    def __init__(
+        self, generate_fn, max_batch_size=8, max_wait=0.01, max_in_flight=1, length_fn=None, bucket_width=32
+    ):
+        self.generate_fn = generate_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.length_fn = length_fn
+        self.bucket_width = max(1, int(bucket_width))
+        self._slots = threading.Semaphore(self.max_in_flight)
+        self._queue = queue.Queue()
+        self._pending = OrderedDict()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="generation-batcher", daemon=True)
+                self._worker.start()
+
+    def qsize(self):
+        return self._queue.qsize() + sum(len(requests) for requests in self._pending.values())
+
+    def submit(self, items, generation_kwargs, on_token=None):
+        self.start()
+
+        bucket = self.length_fn(items) // self.bucket_width if self.length_fn else None
+        request = _Request(items, generation_kwargs, bucket, on_token)
+        self._queue.put(request)
+        request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+
+        return request.result
+
+    def _collect(self, request):
+        self._pending.setdefault(request.key, []).append(request)
+
+    def _next_batch(self):
+        if not self._pending:
+            self._collect(self._queue.get())
+
+        key, requests = next(iter(self._pending.items()))
+        deadline = requests[0].arrived + self.max_wait
+        while len(requests) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            try:
+                self._collect(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        batch = requests[:self.max_batch_size]
+        del self._pending[key]
+        if len(requests) > self.max_batch_size:
+            # re-queue the overflow behind the other configs so no config starves
+            self._pending[key] = requests[self.max_batch_size:]
+
+        return batch
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            batch = self._next_batch()
+            if self.max_in_flight == 1:
+                self._run_batch(batch)
+            else:
+                threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+
+    def _run_batch(self, batch):
+        try:
+            items_list = [request.items for request in batch]
+            token_callbacks = [request.on_token for request in batch]
+            if any(token_callbacks):
+                results = self.generate_fn(items_list, batch[0].generation_kwargs, token_callbacks=token_callbacks)
+            else:
+                results = self.generate_fn(items_list, batch[0].generation_kwargs)
+            for request, result in zip(batch, results):
+                request.result = result
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        finally:
+            self._slots.release()
+            for request in batch:
+                request.done.set()
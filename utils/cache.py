@@ -0,0 +1,316 @@
+import copy
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils.encoding import EXTENSIONS, EncodedImage
+from utils.utils import pure_comma_separation
+
+
+def canonical_items(items):
+    if isinstance(items, str):
+        items = pure_comma_separation(items, return_list=True)
+    else:
+        items = pure_comma_separation(", ".join(items), return_list=True)
+
+    return ", ".join(sorted(items))
+
+
+def is_deterministic(generation_kwargs):
+    return not generation_kwargs.get("do_sample", False)
+
+
+class RecipeCache:
+    """
+    Two tier (memory LRU + optional sqlite) cache of generated recipes.
+
+    Keys are the sorted ingredient set plus the generation kwargs. Deterministic configs keep a
+    single recipe per key; sampling configs are only cached when `variants > 0`, in which case up
+    to `variants` different recipes are collected per key and served at random once complete.
+    """
+
+    def __init__(self, max_size=256, ttl=None, path=None, disk_max_size=10000, variants=0):
+        self.max_size = max_size
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.path = path
+        self.disk_max_size = disk_max_size
+        self.variants = variants
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS recipes ("
+                "key TEXT PRIMARY KEY, created REAL, accessed REAL, value TEXT)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(items, generation_kwargs):
+        raw = json.dumps([canonical_items(items), generation_kwargs], sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def capacity(self, generation_kwargs):
+        return 1 if is_deterministic(generation_kwargs) else self.variants
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._memory),
+        }
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _memory_get(self, key):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+
+        created, variants = entry
+        if self._expired(created):
+            del self._memory[key]
+            return None
+
+        self._memory.move_to_end(key)
+        return entry
+
+    def _memory_set(self, key, created, variants):
+        self._memory[key] = (created, variants)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key):
+        if self._db is None:
+            return None
+
+        row = self._db.execute("SELECT created, value FROM recipes WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        created, value = row
+        if self._expired(created):
+            self._db.execute("DELETE FROM recipes WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+
+        self._db.execute("UPDATE recipes SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return created, json.loads(value)
+
+    def _disk_set(self, key, created, variants):
+        if self._db is None:
+            return
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO recipes (key, created, accessed, value) VALUES (?, ?, ?, ?)",
+            (key, created, time.time(), json.dumps(variants)),
+        )
+        self._db.execute(
+            "DELETE FROM recipes WHERE key IN ("
+            "SELECT key FROM recipes ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_size,),
+        )
+        self._db.commit()
+
+    def _lookup(self, key):
+        entry = self._memory_get(key)
+        if entry is None:
+            entry = self._disk_get(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._memory_set(key, *entry)
+
+        return entry
+
+    def get(self, items, generation_kwargs):
+        capacity = self.capacity(generation_kwargs)
+        if capacity < 1:
+            return None
+
+        with self._lock:
+            entry = self._lookup(self.key(items, generation_kwargs))
+            if entry is None or len(entry[1]) < capacity:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return copy.deepcopy(random.choice(entry[1]))
+
+    def get_variants(self, items, generation_kwargs, count):
+        if self.capacity(generation_kwargs) < count:
+            return None
+
+        with self._lock:
+            entry = self._lookup(self.key(items, generation_kwargs))
+            if entry is None or len(entry[1]) < count:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return copy.deepcopy(random.sample(entry[1], count))
+
+    def put(self, items, generation_kwargs, recipe):
+        capacity = self.capacity(generation_kwargs)
+        if capacity < 1:
+            return
+
+        key = self.key(items, generation_kwargs)
+        recipe = {k: copy.deepcopy(recipe[k]) for k in ("title", "ingredients", "directions") if k in recipe}
+        with self._lock:
+            entry = self._lookup(key)
+            created, variants = entry if entry is not None else (time.time(), [])
+            if len(variants) >= capacity:
+                return
+
+            variants = variants + [recipe]
+            self._memory_set(key, created, variants)
+            self._disk_set(key, created, variants)
+
+
+def content_key(*parts):
+    return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def frame_key(recipe, chef_name, encoder):
+    return content_key(
+        recipe.get("title"),
+        recipe.get("ingredients"),
+        recipe.get("directions"),
+        recipe.get("image"),
+        chef_name.lower(),
+        encoder.settings,
+    )
+
+
+class FrameCache:
+    """
+    Content addressed cache of encoded images (rendered frames, card thumbnails).
+
+    The memory tier is an LRU bounded by `max_bytes`. With `path`, entries are also written there
+    as `frame-<key>.<ext>` files and the least recently used ones are removed once the directory
+    holds more than `disk_max_bytes` of them. The disk order survives restarts through the file
+    modification times. Other files in the directory are never touched.
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20, path=None, disk_max_bytes=512 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.disk_max_bytes = disk_max_bytes
+        self.bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            entries = [
+                entry for entry in os.scandir(self.path)
+                if entry.name.startswith("frame-") and not entry.name.endswith(".tmp") and entry.is_file()
+            ]
+            for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+                self._disk[entry.name] = entry.stat().st_size
+                self.disk_bytes += self._disk[entry.name]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self._memory),
+            "bytes": self.bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self.disk_bytes,
+        }
+
+    def _memory_set(self, key, image):
+        if key in self._memory:
+            self.bytes -= len(self._memory.pop(key).data)
+
+        self._memory[key] = image
+        self.bytes += len(image.data)
+        while self.bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self.bytes -= len(evicted.data)
+
+    def _disk_get(self, key):
+        for format, extension in EXTENSIONS.items():
+            name = f"frame-{key}.{extension}"
+            if name not in self._disk:
+                continue
+
+            try:
+                with open(os.path.join(self.path, name), "rb") as f:
+                    data = f.read()
+                os.utime(os.path.join(self.path, name))
+            except OSError:
+                self.disk_bytes -= self._disk.pop(name)
+                return None
+
+            self._disk.move_to_end(name)
+            return EncodedImage(data, format, None)
+
+        return None
+
+    def _disk_set(self, key, image):
+        name = f"frame-{key}.{image.extension}"
+        tmp_path = os.path.join(self.path, name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(image.data)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+        self.disk_bytes += len(image.data) - self._disk.pop(name, 0)
+        self._disk[name] = len(image.data)
+        while self.disk_bytes > self.disk_max_bytes and self._disk:
+            oldest, size = self._disk.popitem(last=False)
+            self.disk_bytes -= size
+            try:
+                os.remove(os.path.join(self.path, oldest))
+            except OSError:
+                pass
+
+    def get(self, key):
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+            elif self.path:
+                image = self._disk_get(key)
+                if image is not None:
+                    self.disk_hits += 1
+                    self._memory_set(key, image)
+
+            if image is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            if len(image.data) <= self.max_bytes:
+                self._memory_set(key, image)
+            if self.path:
+                self._disk_set(key, image)
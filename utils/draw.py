@@ -1,6 +1,7 @@
 from PIL import (
     Image,
-    ImageDraw
+    ImageDraw,
+    ImageFont
 )
 import textwrap
 from utils.utils import load_image_from_url
@@ -17,16 +18,77 @@ from utils.ext import (
 # )
 
 
+class AssetRegistry:
+    """
+    Keeps the static frame layers in memory so a render only pays for the food photo and the text.
+
+    Every getter returns the shared instance, callers must `.copy()` before drawing on it.
+    """
+
+    def __init__(self):
+        self.images = {}
+        self.logos = {}
+        self.backgrounds = {}
+        self.fonts = {}
+
+    def image(self, path):
+        if path not in self.images:
+            image = Image.open(path)
+            image.load()
+            self.images[path] = image
+
+        return self.images[path]
+
+    def logo(self, path, ratio=3):
+        key = (path, ratio)
+        if key not in self.logos:
+            logo = self.image(path)
+            logo_width, logo_height = logo.size
+            self.logos[key] = logo.resize((logo_width // ratio, logo_height // ratio))
+
+        return self.logos[key]
+
+    def background(self, path, bg_color="#ffffff"):
+        key = (path, bg_color)
+        if key not in self.backgrounds:
+            bg = self.image(path)
+            background = Image.new("RGBA", bg.size, bg_color)
+            background.paste(bg, mask=bg)
+            self.backgrounds[key] = background
+
+        return self.backgrounds[key]
+
+    def font(self, path, size):
+        key = (path, size)
+        if key not in self.fonts:
+            self.fonts[key] = ImageFont.truetype(path, size)
+
+        return self.fonts[key]
+
+    def preload(self, frame_paths=(), logo_paths=(), background_paths=(), bg_color="#ffffff"):
+        for path in frame_paths:
+            self.image(path)
+        for path in logo_paths:
+            self.logo(path)
+        for path in background_paths:
+            self.background(path, bg_color)
+
+
+assets = AssetRegistry()
+
+
 def generate_food_with_logo_image(bg_path, logo_path, food_url, no_food="asset/frame/no_food.png"):
-    bg = Image.open(bg_path)
+    bg = assets.image(bg_path).copy()
     width, height = bg.size
 
-    logo = Image.open(logo_path)
-    logo_width, logo_height, logo_ratio, logo_rb, logo_mb = logo.size + (3, -20, 45)
-    logo_width, logo_height = (logo_width // logo_ratio, logo_height // logo_ratio)
-    logo = logo.resize((logo_width, logo_height))
+    logo = assets.logo(logo_path, ratio=3)
+    logo_width, logo_height = logo.size
+    logo_rb, logo_mb = (-20, 45)
 
-    food = load_image_from_url(food_url, rgba_mode=True, default_image=no_food)
+    if isinstance(food_url, Image.Image):
+        food = food_url
+    else:
+        food = load_image_from_url(food_url, rgba_mode=True, default_image=no_food)
 
     food_width, food_height = (300, 300)
     food = food.resize((food_width, food_height))
@@ -44,10 +106,15 @@ def generate_recipe_image(
         fonts,
         bg_color="#ffffff"
 ):
-    bg = Image.open(bg_path)
-    bg.paste(food_logo_ia, (50, 50), food_logo_ia)
-    bg_color = Image.new("RGBA", bg.size, bg_color)
-    bg_color.paste(bg, mask=bg)
+    # only the area under the food image differs from the cached white composite, so redo just that region
+    box = (50, 50, 50 + food_logo_ia.size[0], 50 + food_logo_ia.size[1])
+    bg = assets.image(bg_path).crop(box)
+    bg.paste(food_logo_ia, (0, 0), food_logo_ia)
+    region = Image.new("RGBA", bg.size, bg_color)
+    region.paste(bg, mask=bg)
+
+    bg_color = assets.background(bg_path, bg_color).copy()
+    bg_color.paste(region, box[:2])
 
     im_editable = ImageDraw.Draw(bg_color)
     im_editable.text(
@@ -0,0 +1,82 @@
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+FORMATS = {"png": "PNG", "webp": "WEBP", "jpeg": "JPEG"}
+MIME_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+
+
+class EncodedImage:
+    __slots__ = ("data", "format", "size", "_data_uri")
+
+    def __init__(self, data, format, size):
+        self.data = data
+        self.format = format
+        self.size = size
+        self._data_uri = None
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.format]
+
+    @property
+    def extension(self):
+        return EXTENSIONS[self.format]
+
+    @property
+    def data_uri(self):
+        # built once, the html card and any later rerender share it
+        if self._data_uri is None:
+            self._data_uri = f"data:{self.mime_type};base64, {base64.b64encode(self.data).decode('utf-8')}"
+        return self._data_uri
+
+
+class ImageEncoder:
+    """
+    Encodes PIL images once into PNG, WebP or JPEG bytes.
+
+    `max_size` downscales (keeping the aspect ratio) before encoding, `quality` applies to WebP
+    and JPEG and `compress_level` (0-9) to PNG. JPEG has no alpha channel, so transparent images
+    are flattened onto `background` first.
+    """
+
+    def __init__(self, format="png", quality=80, compress_level=6, max_size=None, background="#ffffff"):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown image format `{format}`, choose one of {', '.join(FORMATS)}")
+
+        self.format = format
+        self.quality = quality
+        self.compress_level = compress_level
+        self.max_size = max_size
+        self.background = background
+
+    @property
+    def settings(self):
+        return [self.format, self.quality, self.compress_level, self.max_size, self.background]
+
+    def prepare(self, image):
+        if self.max_size and max(image.size) > self.max_size:
+            image = image.copy()
+            image.thumbnail((self.max_size, self.max_size), Image.LANCZOS)
+
+        if self.format == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGBA")
+            flat = Image.new("RGB", image.size, self.background)
+            flat.paste(image, mask=image.getchannel("A"))
+            image = flat
+
+        return image
+
+    def encode(self, image):
+        image = self.prepare(image)
+        buffered = BytesIO()
+        if self.format == "png":
+            image.save(buffered, format="PNG", compress_level=self.compress_level)
+        elif self.format == "webp":
+            image.save(buffered, format="WEBP", quality=self.quality, method=4)
+        else:
+            image.save(buffered, format="JPEG", quality=self.quality, optimize=False)
+
+        return EncodedImage(buffered.getvalue(), self.format, image.size)
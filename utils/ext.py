@@ -1,4 +1,5 @@
 import re
+from utils.matcher import PhraseMatcher
 from utils.utils import replace_regex
 # from .utils import replace_regex
 
@@ -9,33 +10,41 @@ DEFAULT_MAP_DICT = {
     ", thawed": " (thawed)",
     ", melted": " (melted)",
 }
+DEFAULT_MATCHER = PhraseMatcher(DEFAULT_MAP_DICT)
+FRACTION_PATTERN = re.compile(r"(\d)\s(\d\/\d)")
+
+
+def _format(text):
+    text = FRACTION_PATTERN.sub(r" \1+\2 ", text)
+    text = " ".join([word.strip() for word in text.split() if word.strip()])
+    return text
 
 
 def ingredient(text, map_dict):
-    if len(map_dict) > 0:
-        map_dict.update(**DEFAULT_MAP_DICT)
-    else:
-        map_dict = DEFAULT_MAP_DICT
+    map_dict = dict(map_dict)
+    map_dict.update(**DEFAULT_MAP_DICT)
 
     text = replace_regex(text, map_dict)
-    text = re.sub(r"(\d)\s(\d\/\d)", r" \1+\2 ", text)
-    text = " ".join([word.strip() for word in text.split() if word.strip()])
-    return text
+    return _format(text)
 
 
-def ingredients(text_list, item_list, without_mapping=False):
+def ingredient_matcher(item_list, without_mapping=False):
+    if without_mapping or not item_list:
+        return DEFAULT_MATCHER
+
     map_dict = {
         item: f'<span class="text-bold">{item}</span>' for item in list(map(lambda x: x.lower().strip(), item_list))
     }
-    text_list = list(map(lambda x: x.lower(), text_list))
+    map_dict.update(**DEFAULT_MAP_DICT)
+
+    return PhraseMatcher(map_dict)
 
-    output = []
-    for text in text_list:
-        map_dict = map_dict if not without_mapping else {}
-        text = ingredient(text, map_dict)
-        output.append(text)
 
-    return output
+def ingredients(text_list, item_list, without_mapping=False, matcher=None):
+    matcher = matcher if matcher is not None else ingredient_matcher(item_list, without_mapping)
+    text_list = list(map(lambda x: x.lower(), text_list))
+
+    return [_format(text) for text in matcher.sub_all(text_list)]
 
 
 def directions(text_list):
@@ -0,0 +1,236 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+import torch
+from transformers import LogitsProcessor
+from transformers.modeling_outputs import BaseModelOutput
+
+_model_lock = threading.RLock()
+_ENCODER_KWARGS = {"attention_mask", "output_attentions", "output_hidden_states", "use_cache", "return_dict"}
+
+
+@contextmanager
+def _patched(model, name, value):
+    # restores whatever was there before, so hooks can nest
+    previous = model.__dict__.get(name)
+    setattr(model, name, value)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del model.__dict__[name]
+        else:
+            setattr(model, name, previous)
+
+
+@contextmanager
+def generation_hooks(model, logits_processors=(), encoder_cache=None):
+    """
+    Serializes generation on `model` and appends `logits_processors` to the ones `generate`
+    builds itself (transformers 4.9 has no `logits_processor` argument on `generate`).
+    With an `encoder_cache`, encoder outputs are looked up there before running the encoder.
+    """
+    with _model_lock, ExitStack() as hooks:
+        if logits_processors:
+            build_processors = model._get_logits_processor
+
+            def _get_logits_processor(*args, **kwargs):
+                processors = build_processors(*args, **kwargs)
+                processors.extend(logits_processors)
+                return processors
+
+            hooks.enter_context(_patched(model, "_get_logits_processor", _get_logits_processor))
+
+        if encoder_cache is not None:
+            prepare_encoder_outputs = model._prepare_encoder_decoder_kwargs_for_generation
+
+            def _prepare_encoder_decoder_kwargs_for_generation(input_ids, model_kwargs):
+                if "encoder_outputs" not in model_kwargs:
+                    encoder_outputs = encoder_cache.encode(model, input_ids, model_kwargs)
+                    if encoder_outputs is not None:
+                        model_kwargs["encoder_outputs"] = encoder_outputs
+
+                return prepare_encoder_outputs(input_ids, model_kwargs)
+
+            hooks.enter_context(_patched(
+                model, "_prepare_encoder_decoder_kwargs_for_generation", _prepare_encoder_decoder_kwargs_for_generation
+            ))
+
+        yield model
+
+
+class TokenCallbackProcessor(LogitsProcessor):
+    """Calls `callback(input_ids)` once per decoding step without touching the scores."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, input_ids, scores):
+        self.callback(input_ids)
+        return scores
+
+
+def _route(scores, rows, source, target):
+    """Moves the probability of `source` onto `target` for `rows`, so ending an item ends the section instead."""
+    # a target another processor ruled out (`</s>` before `min_length`) stays ruled out
+    rows = rows & (scores[:, target] > -float("inf"))
+    if bool(rows.any()):
+        scores[rows, target] = torch.logaddexp(scores[rows, source], scores[rows, target])
+        scores[rows, source] = -float("inf")
+
+
+class RecipeStopProcessor(LogitsProcessor):
+    """
+    Ends every sequence as soon as it holds a complete recipe.
+
+    The model writes the title, ingredients and directions sections in that order, joined by
+    `<section>`. Once a sequence is in its last section a `<section>` can only start a second,
+    unused recipe, so its score is folded into `</s>` instead. `max_ingredients` and
+    `max_directions` do the same with the `<sep>` that would start one item too many, closing the
+    section (or the recipe) after that many items.
+
+    The section counts are recomputed from `input_ids` at every step, which keeps the processor
+    stateless and therefore correct when beam search reorders the rows.
+    """
+
+    def __init__(
+        self, eos_token_id, section_token_id, sep_token_id, max_ingredients=None, max_directions=None, num_sections=3
+    ):
+        self.eos_token_id = eos_token_id
+        self.section_token_id = section_token_id
+        self.sep_token_id = sep_token_id
+        self.max_ingredients = max_ingredients
+        self.max_directions = max_directions
+        self.last_section = num_sections - 1
+
+    def __call__(self, input_ids, scores):
+        is_section = input_ids == self.section_token_id
+        sections = is_section.sum(dim=-1)
+        in_directions = sections >= self.last_section
+        _route(scores, in_directions, self.section_token_id, self.eos_token_id)
+
+        if self.max_ingredients or self.max_directions:
+            positions = torch.arange(input_ids.shape[-1], device=input_ids.device)
+            last_section = torch.where(is_section, positions, positions.new_full((), -1)).max(dim=-1).values
+            items = ((input_ids == self.sep_token_id) & (positions > last_section[:, None])).sum(dim=-1) + 1
+            if self.max_ingredients:
+                rows = (sections == self.last_section - 1) & (items >= self.max_ingredients)
+                _route(scores, rows, self.sep_token_id, self.section_token_id)
+            if self.max_directions:
+                _route(scores, in_directions & (items >= self.max_directions), self.sep_token_id, self.eos_token_id)
+
+        return scores
+
+
+class EncoderCache:
+    """
+    LRU cache of encoder hidden states keyed by the unpadded input token ids, bounded by bytes.
+
+    The encoder output only depends on the input ids, so every decoding config (sampling, beam
+    search, K variants) for the same ingredients reuses one encoder pass. Rows of a batch are
+    looked up one by one and only the missing ones go through the encoder. Changing the ingredient
+    list changes every encoder state (the encoder attends in both directions), so only exact
+    repeats can be reused.
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tokens_saved = 0
+        self.tokens_encoded = 0
+        self.encode_seconds = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        tokens = self.tokens_saved + self.tokens_encoded
+        seconds_per_token = self.encode_seconds / self.tokens_encoded if self.tokens_encoded else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "tokens_saved": self.tokens_saved,
+            "tokens_encoded": self.tokens_encoded,
+            "saved_ratio": self.tokens_saved / tokens if tokens else 0.0,
+            "encode_seconds": self.encode_seconds,
+            # estimated from the measured cost of the encoder passes that did run
+            "seconds_saved": self.tokens_saved * seconds_per_token,
+        }
+
+    def get(self, key):
+        with self._lock:
+            hidden = self._entries.get(key)
+            if hidden is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.tokens_saved += len(key)
+            return hidden
+
+    def put(self, key, hidden):
+        size = hidden.element_size() * hidden.nelement()
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+
+            self._entries[key] = hidden
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.element_size() * evicted.nelement()
+                self.evictions += 1
+
+    def encode(self, model, input_ids, model_kwargs):
+        """Returns the `encoder_outputs` for `generate`, or None when the call needs the plain encoder."""
+        encoder_kwargs = {k: v for k, v in model_kwargs.items() if not k.startswith(("decoder_", "cross_attn"))}
+        if set(encoder_kwargs) - _ENCODER_KWARGS:
+            return None
+        if encoder_kwargs.get("output_attentions") or encoder_kwargs.get("output_hidden_states"):
+            return None
+
+        attention_mask = encoder_kwargs.get("attention_mask")
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+
+        lengths = attention_mask.sum(dim=-1).tolist()
+        # the per row states are only valid without left padding
+        if any(not bool(attention_mask[i, :length].all()) for i, length in enumerate(lengths)):
+            return None
+
+        keys = [tuple(input_ids[i, :length].tolist()) for i, length in enumerate(lengths)]
+        hidden = [self.get(key) for key in keys]
+        missing = [i for i, h in enumerate(hidden) if h is None]
+        if missing:
+            start = time.perf_counter()
+            index = torch.tensor(missing, device=input_ids.device)
+            encoded = model.get_encoder()(
+                input_ids=input_ids.index_select(0, index),
+                attention_mask=attention_mask.index_select(0, index),
+                return_dict=True,
+            ).last_hidden_state
+            self.encode_seconds += time.perf_counter() - start
+            for row, i in enumerate(missing):
+                # a copy, so the cache does not keep the whole padded batch alive
+                hidden[i] = encoded[row, :lengths[i]].clone()
+                self.tokens_encoded += lengths[i]
+                self.put(keys[i], hidden[i])
+
+        last_hidden_state = hidden[0].new_zeros(input_ids.shape + hidden[0].shape[-1:])
+        for i, h in enumerate(hidden):
+            last_hidden_state[i, :h.shape[0]] = h
+
+        return BaseModelOutput(last_hidden_state=last_hidden_state)
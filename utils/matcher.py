@@ -0,0 +1,61 @@
+_END = ""
+
+
+class PhraseMatcher:
+    """
+    Trie based multi-phrase replacement.
+
+    Gives the same result as `replace_regex` with the keys in insertion order (leftmost match,
+    earlier keys win over later ones at the same position), but the cost per character depends
+    on the phrase length instead of the number of phrases, so it scales to large vocabularies
+    and is built once and reused across lines and requests.
+    """
+
+    def __init__(self, replacements):
+        self.root = {}
+        self.size = 0
+        for priority, (phrase, replacement) in enumerate(replacements.items()):
+            if not phrase:
+                continue
+
+            node = self.root
+            for char in phrase:
+                node = node.setdefault(char, {})
+
+            node[_END] = (priority, replacement)
+            self.size += 1
+
+    def _match(self, text, start):
+        node, best = self.root, None
+        for end in range(start, len(text)):
+            node = node.get(text[end])
+            if node is None:
+                break
+
+            found = node.get(_END)
+            if found is not None and (best is None or found[0] < best[0]):
+                best = (found[0], found[1], end + 1)
+
+        return best
+
+    def sub(self, text):
+        text = str(text)
+        if not self.size:
+            return text
+
+        output, last, i = [], 0, 0
+        while i < len(text):
+            match = self._match(text, i) if text[i] in self.root else None
+            if match is None:
+                i += 1
+                continue
+
+            output.append(text[last:i])
+            output.append(match[1])
+            i = last = match[2]
+
+        output.append(text[last:])
+        return "".join(output)
+
+    def sub_all(self, texts):
+        return [self.sub(text) for text in texts]
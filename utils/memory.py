@@ -0,0 +1,40 @@
+import resource
+import sys
+
+_STATUS_FIELDS = {"VmRSS": "rss_mb", "RssAnon": "anon_mb", "RssFile": "file_mb", "RssShmem": "shmem_mb"}
+
+
+def _read_kb(path, fields):
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    values[fields[name]] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+
+    return values
+
+
+def memory_usage():
+    """
+    Resident memory of this process in MB.
+
+    On Linux `anon_mb` is memory private to the process, `file_mb` file pages it maps (memory-mapped
+    weights, shared with every other process mapping them) and `pss_mb` the proportional share, which
+    sums to the real total across replicas. Elsewhere only the peak RSS is known.
+    """
+    usage = _read_kb("/proc/self/status", _STATUS_FIELDS)
+    usage.update(_read_kb("/proc/self/smaps_rollup", {"Pss": "pss_mb"}))
+    if not usage:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes on linux
+        usage["peak_rss_mb"] = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+    return usage
+
+
+def format_usage(usage):
+    return ", ".join(f"{name}={value:.0f}" for name, value in usage.items())
@@ -0,0 +1,143 @@
+import math
+import re
+from collections import Counter
+
+_TOKENS = re.compile(r"\w+|[^\w\s]")
+MAX_ORDER = 4
+
+
+def tokenize(text):
+    return _TOKENS.findall(text.lower())
+
+
+def ngrams(tokens, n):
+    return Counter(zip(*[tokens[i:] for i in range(n)]))
+
+
+def edit_distance(a, b):
+    """Token level Levenshtein distance, bit-parallel (Hyyrö 2001) with one Python int per column."""
+    if not a or not b:
+        return len(a) or len(b)
+
+    peq = {}
+    for i, token in enumerate(a):
+        peq[token] = peq.get(token, 0) | (1 << i)
+
+    mask = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    pv, mv, score = mask, 0, len(a)
+    for token in b:
+        eq = peq.get(token, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+
+    return score
+
+
+def wer(prediction, reference):
+    return edit_distance(prediction, reference) / max(1, len(reference))
+
+
+def rouge_n(prediction, reference, n=2):
+    return _f1(ngrams(prediction, n), ngrams(reference, n))
+
+
+def _overlap(prediction, reference):
+    return sum(min(count, reference[gram]) for gram, count in prediction.items() if gram in reference)
+
+
+def _f1(prediction, reference):
+    overlap = _overlap(prediction, reference)
+    if not overlap:
+        return 0.0
+
+    precision = overlap / sum(prediction.values())
+    recall = overlap / sum(reference.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+class SectionStats:
+    """
+    Mergeable metric accumulator for one recipe section.
+
+    BLEU keeps the corpus level clipped n-gram counts (every prediction against all references),
+    ROUGE-2 and WER keep the sum of the best prediction/reference pair per row, so partial results
+    from several processes add up to exactly the single process result.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.matches = [0] * MAX_ORDER
+        self.totals = [0] * MAX_ORDER
+        self.prediction_length = 0
+        self.reference_length = 0
+        self.rouge2 = 0.0
+        self.wer = 0.0
+
+    def add(self, predictions, references):
+        predictions = [tokenize(p) for p in predictions]
+        references = [tokenize(r) for r in references]
+        if not predictions or not references:
+            return
+
+        self.rows += 1
+        # n-grams are counted once per text and shared by BLEU and ROUGE-2
+        reference_grams = [[ngrams(r, n) for n in range(1, MAX_ORDER + 1)] for r in references]
+        max_counts = reference_grams[0]
+        if len(reference_grams) > 1:
+            max_counts = [Counter() for _ in range(MAX_ORDER)]
+            for grams in reference_grams:
+                for n in range(MAX_ORDER):
+                    max_counts[n] |= grams[n]
+
+        rouge2 = 0.0
+        for prediction in predictions:
+            self.prediction_length += len(prediction)
+            # the closest reference length, the shorter one on ties
+            self.reference_length += min((abs(len(r) - len(prediction)), len(r)) for r in references)[1]
+            grams = [ngrams(prediction, n) for n in range(1, MAX_ORDER + 1)]
+            for n in range(MAX_ORDER):
+                self.matches[n] += _overlap(grams[n], max_counts[n])
+                self.totals[n] += max(0, len(prediction) - n)
+
+            rouge2 = max([rouge2] + [_f1(grams[1], reference[1]) for reference in reference_grams])
+
+        self.rouge2 += rouge2
+        self.wer += min(wer(p, r) for p in predictions for r in references)
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.matches = [a + b for a, b in zip(self.matches, other.matches)]
+        self.totals = [a + b for a, b in zip(self.totals, other.totals)]
+        self.prediction_length += other.prediction_length
+        self.reference_length += other.reference_length
+        self.rouge2 += other.rouge2
+        self.wer += other.wer
+        return self
+
+    def bleu(self):
+        if not self.prediction_length or not all(self.matches):
+            return 0.0
+
+        log_precision = sum(math.log(m / t) for m, t in zip(self.matches, self.totals)) / MAX_ORDER
+        brevity = min(0.0, 1 - self.reference_length / self.prediction_length)
+        return math.exp(brevity + log_precision)
+
+    def summary(self):
+        return {
+            "rows": self.rows,
+            "bleu": self.bleu(),
+            "rouge2": self.rouge2 / self.rows if self.rows else 0.0,
+            "wer": self.wer / self.rows if self.rows else 0.0,
+        }
@@ -0,0 +1,99 @@
+import re
+from functools import lru_cache
+
+RECIPE_MAPS = {"<sep>": "--", "<section>": "\n"}
+SECTIONS = ("title", "ingredients", "directions")
+# the tokenizer's special tokens, for parsing without loading it; <sep> and <section> are regular added tokens
+T5_SPECIAL_TOKENS = ("</s>", "<unk>", "<pad>") + tuple(f"<extra_id_{i}>" for i in range(100))
+
+
+class Recipe:
+    __slots__ = ("title", "ingredients", "directions")
+
+    def __init__(self, title="", ingredients=None, directions=None):
+        self.title = title
+        self.ingredients = ingredients if ingredients is not None else []
+        self.directions = directions if directions is not None else []
+
+    def to_dict(self):
+        return {"title": self.title, "ingredients": self.ingredients, "directions": self.directions}
+
+    def __eq__(self, other):
+        return isinstance(other, Recipe) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Recipe(title={self.title!r}, ingredients={self.ingredients!r}, directions={self.directions!r})"
+
+
+@lru_cache(maxsize=8)
+def _compile(special_tokens):
+    # special tokens come first so they win over the recipe maps, as in the original two-pass version
+    tokens = list(special_tokens) + [token for token in RECIPE_MAPS if token not in special_tokens]
+    return re.compile("|".join(map(re.escape, tokens)))
+
+
+class RecipeParser:
+    """
+    Turns the decoded model output into a `Recipe`.
+
+    The special token pattern is compiled once per token set and the text is rewritten in a
+    single regex pass. `parse_ids` skips the text round trip and splits on the `<sep>` and
+    `<section>` token ids directly.
+    """
+
+    def __init__(self, special_tokens=(), sep_token_id=None, section_token_id=None):
+        self.special_tokens = frozenset(special_tokens)
+        self.pattern = _compile(tuple(special_tokens))
+        self.sep_token_id = sep_token_id
+        self.section_token_id = section_token_id
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer):
+        sep_token_id, section_token_id = tokenizer.convert_tokens_to_ids(["<sep>", "<section>"])
+        if tokenizer.unk_token_id in (sep_token_id, section_token_id):
+            sep_token_id = section_token_id = None
+
+        return cls(tokenizer.all_special_tokens, sep_token_id, section_token_id)
+
+    def _replace(self, match):
+        token = match.group()
+        return "" if token in self.special_tokens else RECIPE_MAPS[token]
+
+    def parse(self, text):
+        recipe = Recipe()
+        for section in self.pattern.sub(self._replace, text).split("\n"):
+            self._parse_section(recipe, section)
+
+        return recipe
+
+    def parse_ids(self, token_ids, tokenizer):
+        if self.sep_token_id is None or self.special_tokens & set(RECIPE_MAPS):
+            return self.parse(tokenizer.decode(token_ids, skip_special_tokens=False))
+
+        recipe = Recipe()
+        section, piece = [], []
+        for token_id in list(token_ids) + [self.section_token_id]:
+            token_id = int(token_id)
+            if token_id == self.sep_token_id or token_id == self.section_token_id:
+                section.append(tokenizer.decode(piece, skip_special_tokens=True))
+                piece = []
+                if token_id == self.section_token_id:
+                    for line in "--".join(section).split("\n"):
+                        self._parse_section(recipe, line)
+                    section = []
+            else:
+                piece.append(token_id)
+
+        return recipe
+
+    @staticmethod
+    def _parse_section(recipe, section):
+        section = section.strip()
+        if section.startswith("title:"):
+            recipe.title = " ".join(
+                [w.strip().capitalize() for w in section.replace("title:", "").strip().split() if w.strip()]
+            )
+        elif section.startswith("ingredients:"):
+            recipe.ingredients = [s.strip() for s in section.replace("ingredients:", "").split('--')]
+        elif section.startswith("directions:"):
+            recipe.directions = [s.strip() for s in section.replace("directions:", "").split('--')]
@@ -0,0 +1,64 @@
+import json
+import math
+
+from utils.utils import pure_comma_separation
+
+
+def count_items(items):
+    if isinstance(items, str):
+        return len(pure_comma_separation(items, return_list=True))
+
+    return len(pure_comma_separation(", ".join(items), return_list=True))
+
+
+class LengthPlanner:
+    """
+    Picks a per request `max_length` from the number of ingredients.
+
+    `lengths` maps an ingredient count to a high quantile of the generated token lengths seen for
+    that count (see `mine_lengths.py`). It is made non-decreasing first, so more ingredients never
+    get a smaller budget, and counts that were never seen use the next larger one. The prediction
+    gets `margin` on top and is rounded up to a multiple of `step`, so similar requests still share
+    a batch. The planned value never exceeds the requested `max_length`, and counts above the
+    largest one seen keep it unchanged.
+    """
+
+    def __init__(self, lengths=None, margin=0.15, step=64):
+        self.margin = margin
+        self.step = step
+        self.lengths = {}
+        longest = 0
+        for count, length in sorted((int(c), int(l)) for c, l in (lengths or {}).items()):
+            longest = max(longest, length)
+            self.lengths[count] = longest
+
+        self._counts = sorted(self.lengths)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path) as f:
+            stats = json.load(f)
+
+        return cls(stats["lengths"], **kwargs)
+
+    def predict(self, num_items):
+        for count in self._counts:
+            if count >= num_items:
+                length = math.ceil(self.lengths[count] * (1 + self.margin))
+                return math.ceil(length / self.step) * self.step
+
+        return None
+
+    def plan(self, items, generation_kwargs):
+        """Returns `generation_kwargs` with a lower `max_length` when the statistics allow one."""
+        max_length = generation_kwargs.get("max_length")
+        planned = self.predict(count_items(items))
+        if planned is None or max_length is None or planned >= max_length:
+            return generation_kwargs
+
+        # still leave room for the decoding that `min_length` asks for
+        planned = max(planned, generation_kwargs.get("min_length", 0) + self.step)
+        if planned >= max_length:
+            return generation_kwargs
+
+        return dict(generation_kwargs, max_length=planned)
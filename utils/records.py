@@ -0,0 +1,179 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b"CHEFCOL1"
+_HEADER = struct.Struct("<8sQ")
+_OFFSET = struct.Struct("<Q")
+
+
+def to_columns(data):
+    """Accepts a list of row dicts, a dict of equally long column lists or a dict wrapping one of those."""
+    if isinstance(data, dict):
+        lists = {k: v for k, v in data.items() if isinstance(v, list)}
+        if len(lists) == 1 and all(isinstance(row, dict) for row in next(iter(lists.values()))):
+            return to_columns(next(iter(lists.values())))
+
+        lengths = {len(v) for v in lists.values()}
+        if not lists or len(lengths) != 1:
+            raise ValueError("Expected a list of rows or a dict of equally long columns")
+
+        return lists
+
+    if isinstance(data, list):
+        if not all(isinstance(row, dict) for row in data):
+            return {"value": data}
+
+        names = []
+        for row in data:
+            for name in row:
+                if name not in names:
+                    names.append(name)
+
+        return {name: [row.get(name) for row in data] for name in names}
+
+    raise ValueError("Expected a list of rows or a dict of equally long columns")
+
+
+def read_rows(path):
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_columns(path, data):
+    """
+    Writes rows (or columns) to a single file of per-column offsets + bytes.
+
+    Text columns are stored as raw utf-8, everything else as one JSON document per value, so a
+    reader can seek to any value of any column without parsing the others.
+    """
+    columns = to_columns(data)
+    num_rows = len(next(iter(columns.values()))) if columns else 0
+
+    blobs, meta = [], {}
+    for name, values in columns.items():
+        kind = "str" if all(isinstance(v, str) for v in values) else "json"
+        encoded = [(v if kind == "str" else json.dumps(v, ensure_ascii=False)).encode("utf-8") for v in values]
+        offsets = [0]
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+
+        blobs.append((b"".join(_OFFSET.pack(o) for o in offsets), b"".join(encoded)))
+        meta[name] = {"kind": kind}
+
+    # positions are relative to the end of the header
+    position = 0
+    for (offsets, values), name in zip(blobs, meta):
+        meta[name].update(offsets=position, data=position + len(offsets), size=len(values))
+        position += len(offsets) + len(values)
+
+    header = json.dumps({"rows": num_rows, "columns": meta}).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for offsets, values in blobs:
+            f.write(offsets)
+            f.write(values)
+
+    return num_rows
+
+
+class Column:
+    def __init__(self, records, name):
+        self.records = records
+        self.name = name
+        meta = records.meta[name]
+        self.kind = meta["kind"]
+        self._data = records.base + meta["data"]
+        # n + 1 packed uint64, 8 bytes per row however large the values are
+        start = records.base + meta["offsets"]
+        self.offsets = array("Q", records.buffer[start:start + (len(records) + 1) * _OFFSET.size])
+        if sys.byteorder == "big":
+            self.offsets.byteswap()
+
+    def __len__(self):
+        return len(self.records)
+
+    def raw(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"row {index} out of range")
+
+        index %= len(self)
+        return self.records.buffer[self._data + self.offsets[index]:self._data + self.offsets[index + 1]]
+
+    def _decode(self, raw):
+        value = raw.decode("utf-8")
+        return value if self.kind == "str" else json.loads(value)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        return self._decode(self.raw(index))
+
+    def __iter__(self):
+        buffer, data, offsets = self.records.buffer, self._data, self.offsets
+        for i in range(len(self)):
+            yield self._decode(buffer[data + offsets[i]:data + offsets[i + 1]])
+
+
+class ColumnarRecords:
+    """
+    Memory-mapped reader for `write_columns` files.
+
+    Nothing is decoded up front: `records[i]` decodes one row, `records.column(name)[i]` a single
+    value, and iterating streams the rows, so only what is actually read ends up as Python objects.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = _HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a columnar records file")
+
+        header = json.loads(bytes(self.buffer[_HEADER.size:_HEADER.size + header_size]))
+        self.num_rows = header["rows"]
+        self.meta = header["columns"]
+        self.base = _HEADER.size + header_size
+        self.columns = {name: Column(self, name) for name in self.meta}
+
+    def __len__(self):
+        return self.num_rows
+
+    def column(self, name):
+        return self.columns[name]
+
+    def row(self, index, columns=None):
+        return {name: self.columns[name][index] for name in (columns or self.columns)}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.row(i) for i in range(*index.indices(len(self)))]
+
+        return self.row(index)
+
+    def iter_rows(self, columns=None, start=0, stop=None):
+        for i in range(start, len(self) if stop is None else min(stop, len(self))):
+            yield self.row(i, columns)
+
+    def __iter__(self):
+        return self.iter_rows()
+
+    def close(self):
+        self.buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
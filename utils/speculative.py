@@ -0,0 +1,291 @@
+import copy
+import threading
+from collections import OrderedDict
+
+import torch
+from torch import nn
+
+# what the speculative loop implements itself, anything else goes through `generate`
+SUPPORTED_KWARGS = {
+    "max_length", "min_length", "do_sample", "top_k", "top_p", "temperature", "num_beams", "num_beam_groups",
+    "num_return_sequences", "no_repeat_ngram_size", "encoder_no_repeat_ngram_size", "repetition_penalty",
+    "bad_words_ids", "eos_token_id", "pad_token_id", "bos_token_id", "decoder_start_token_id",
+    "forced_bos_token_id", "forced_eos_token_id", "remove_invalid_values",
+    # only change beam search
+    "early_stopping", "length_penalty",
+}
+
+
+def _vocab_head(lm_head, vocab):
+    weight = lm_head.weight
+    # int8 (dynamically quantized) heads keep a packed weight behind a method
+    weight = weight() if callable(weight) else weight
+    weight = weight.dequantize() if weight.is_quantized else weight
+    head = nn.Linear(weight.shape[1], len(vocab), bias=False).to(weight.dtype)
+    head.weight = nn.Parameter(weight[torch.tensor(vocab)].clone(), requires_grad=False)
+    return head
+
+
+def truncated_draft(model, num_layers, vocab=None):
+    """
+    A draft made of the first `num_layers` decoder blocks of `model`, followed by its final layer norm
+    and LM head. Every module is shared with `model`, so the draft costs no memory and reuses the
+    encoder output of the main model.
+
+    With `vocab` (token ids) the draft only scores those tokens. The LM head is the largest matrix a
+    decoding step multiplies with, so a few thousand recipe tokens instead of the full vocabulary make
+    the draft several times cheaper.
+    """
+    draft = copy.copy(model)
+    draft._modules = OrderedDict(model._modules)
+    decoder = copy.copy(model.decoder)
+    decoder._modules = OrderedDict(model.decoder._modules)
+    decoder.block = nn.ModuleList(model.decoder.block[:num_layers])
+    draft.decoder = decoder
+    draft.vocab = None
+    if vocab:
+        draft.lm_head = _vocab_head(model.lm_head, vocab)
+        draft.vocab = torch.tensor(vocab)
+    return draft
+
+
+def _same_weights(module, other):
+    state, other_state = module.state_dict(), other.state_dict()
+    return state.keys() == other_state.keys() and all(
+        state[name].dtype == other_state[name].dtype and torch.equal(state[name], other_state[name])
+        for name in state
+    )
+
+
+def load_draft(path, model):
+    """
+    Loads a draft checkpoint (see `distill_draft.py`). A draft trained with the encoder frozen gets
+    the encoder and embeddings of `model` instead of its own copies.
+    """
+    from transformers import AutoModelForSeq2SeqLM
+
+    draft = AutoModelForSeq2SeqLM.from_pretrained(path).eval()
+    if _same_weights(draft.shared, model.shared) and _same_weights(draft.encoder, model.encoder):
+        draft.shared = model.shared
+        draft.encoder = model.encoder
+        draft.decoder.embed_tokens = model.shared
+        if draft.config.tie_word_embeddings:
+            draft.lm_head = model.lm_head
+
+    vocab = getattr(draft.config, "draft_vocab", None)
+    return truncated_draft(draft, draft.config.num_decoder_layers, vocab=vocab)
+
+
+class _Decoder:
+    """Runs the decoder of `model` over a growing token list, keeping the self-attention cache in step."""
+
+    def __init__(self, model, encoder_outputs, attention_mask):
+        self.model = model
+        self.encoder_outputs = encoder_outputs
+        self.attention_mask = attention_mask
+        self.past = None
+        self.cached = 0
+
+    def logits(self, tokens):
+        """Logits after each of the tokens that are not cached yet."""
+        # the T5 forward only feeds the last decoder token once there is a cache, so the decoder and the
+        # LM head are called the way it calls them
+        outputs = self.model.decoder(
+            input_ids=torch.tensor([tokens[self.cached:]], device=self.attention_mask.device),
+            encoder_hidden_states=self.encoder_outputs.last_hidden_state,
+            encoder_attention_mask=self.attention_mask,
+            past_key_values=self.past,
+            use_cache=True,
+            return_dict=True,
+        )
+        self.past = outputs.past_key_values
+        self.cached = len(tokens)
+        hidden = outputs.last_hidden_state[0]
+        if self.model.config.tie_word_embeddings:
+            hidden = hidden * self.model.model_dim ** -0.5
+        logits = self.model.lm_head(hidden)
+        vocab = getattr(self.model, "vocab", None)
+        if vocab is None:
+            return logits
+
+        # tokens outside the draft's vocabulary are never proposed
+        full = logits.new_full((logits.shape[0], self.model.config.vocab_size), -float("inf"))
+        full[:, vocab] = logits
+        return full
+
+    def rewind(self, length):
+        # T5 keeps (self key, self value, cross key, cross value) per layer, only the first two grow
+        if self.cached > length:
+            self.past = tuple(
+                (layer[0][:, :, :length], layer[1][:, :, :length]) + tuple(layer[2:]) for layer in self.past
+            )
+            self.cached = length
+
+
+class SpeculativeDecoder:
+    """
+    Speculative decoding: the draft proposes `num_draft_tokens` tokens one by one, and the main model
+    scores all of them in a single forward pass.
+
+    Greedy decoding keeps the proposals up to the first one the main model would not have picked,
+    followed by the main model's own token, so the output is the main model's greedy output (up to
+    floating point ties). Sampling accepts a proposal with probability `min(1, p / q)` and otherwise
+    samples from `max(0, p - q)`, which leaves the distribution of the main model unchanged
+    (Leviathan et al., 2023). The logits processors of `generate` (and the ones `generation_hooks`
+    adds) are applied to every prefix the main model keeps, in order, so they see exactly the tokens
+    that end up in the output. Beam search is not supported and stays with `generate`.
+    """
+
+    def __init__(self, draft=None, num_draft_tokens=4):
+        self.draft = draft
+        self.num_draft_tokens = num_draft_tokens
+        self.sequences = 0
+        self.steps = 0
+        self.tokens = 0
+        self.drafted = 0
+        self.accepted = 0
+        self._lock = threading.Lock()
+
+    def stats(self):
+        return {
+            "sequences": self.sequences,
+            "steps": self.steps,
+            "tokens": self.tokens,
+            "drafted": self.drafted,
+            "accepted": self.accepted,
+            "acceptance_rate": self.accepted / self.drafted if self.drafted else 0.0,
+            # tokens per forward pass of the main model, 1.0 without a draft
+            "tokens_per_step": self.tokens / self.steps if self.steps else 0.0,
+        }
+
+    def supports(self, model, generation_kwargs):
+        num_beams = generation_kwargs.get("num_beams") or model.config.num_beams
+        num_beam_groups = generation_kwargs.get("num_beam_groups") or model.config.num_beam_groups
+        return (
+            self.draft is not None and num_beams == 1 and num_beam_groups == 1
+            and not set(generation_kwargs) - SUPPORTED_KWARGS
+        )
+
+    @torch.no_grad()
+    def generate(self, model, input_ids, attention_mask, generation_kwargs, encoder_outputs=None):
+        """Returns `num_return_sequences` token lists for the single input in `input_ids`, like `generate`."""
+        config = model.config
+        kwargs = {name: getattr(config, name, None) for name in SUPPORTED_KWARGS}
+        kwargs.update({k: v for k, v in generation_kwargs.items() if v is not None})
+        if kwargs["decoder_start_token_id"] is None:
+            kwargs["decoder_start_token_id"] = kwargs["bos_token_id"]
+
+        processor_kwargs = dict(
+            repetition_penalty=generation_kwargs.get("repetition_penalty"),
+            no_repeat_ngram_size=generation_kwargs.get("no_repeat_ngram_size"),
+            encoder_no_repeat_ngram_size=generation_kwargs.get("encoder_no_repeat_ngram_size"),
+            encoder_input_ids=input_ids,
+            bad_words_ids=generation_kwargs.get("bad_words_ids"),
+            min_length=generation_kwargs.get("min_length"),
+            max_length=kwargs["max_length"],
+            eos_token_id=kwargs["eos_token_id"],
+            forced_bos_token_id=generation_kwargs.get("forced_bos_token_id"),
+            forced_eos_token_id=generation_kwargs.get("forced_eos_token_id"),
+            prefix_allowed_tokens_fn=None,
+            num_beams=1,
+            num_beam_groups=1,
+            diversity_penalty=None,
+            remove_invalid_values=generation_kwargs.get("remove_invalid_values"),
+        )
+        # the draft gets the plain processors: the ones `generation_hooks` adds (early stop, token callbacks)
+        # must only see tokens the model kept
+        processors = model._get_logits_processor(**processor_kwargs)
+        draft_processors = type(self.draft)._get_logits_processor(self.draft, **processor_kwargs)
+        warpers = None
+        if kwargs["do_sample"]:
+            warpers = model._get_logits_warper(
+                top_k=generation_kwargs.get("top_k"),
+                top_p=generation_kwargs.get("top_p"),
+                temperature=generation_kwargs.get("temperature"),
+                num_beams=1,
+            )
+
+        if encoder_outputs is None:
+            encoder_outputs = model.get_encoder()(input_ids=input_ids, attention_mask=attention_mask, return_dict=True)
+        draft_encoder_outputs = encoder_outputs
+        if self.draft.get_encoder() is not model.get_encoder():
+            draft_encoder_outputs = self.draft.get_encoder()(
+                input_ids=input_ids, attention_mask=attention_mask, return_dict=True
+            )
+
+        return [
+            self._generate_one(
+                _Decoder(model, encoder_outputs, attention_mask),
+                _Decoder(self.draft, draft_encoder_outputs, attention_mask),
+                processors, draft_processors, warpers, kwargs,
+            )
+            for _ in range(kwargs["num_return_sequences"])
+        ]
+
+    def _scores(self, processors, warpers, tokens, logits):
+        input_ids = torch.tensor([tokens], device=logits.device)
+        scores = processors(input_ids, logits[None])
+        if warpers is not None:
+            scores = warpers(input_ids, scores)
+        return scores[0]
+
+    def _generate_one(self, main, draft, processors, draft_processors, warpers, kwargs):
+        max_length, eos_token_id = kwargs["max_length"], kwargs["eos_token_id"]
+        tokens = [kwargs["decoder_start_token_id"]]
+        steps = drafted = accepted = 0
+        while len(tokens) < max_length and (len(tokens) == 1 or tokens[-1] != eos_token_id):
+            # the main model adds one token of its own, so leave room for it
+            proposals, draft_probs = [], []
+            for _ in range(min(self.num_draft_tokens, max_length - len(tokens) - 1)):
+                scores = self._scores(draft_processors, warpers, tokens + proposals, draft.logits(tokens + proposals)[-1])
+                if warpers is None:
+                    proposals.append(int(scores.argmax()))
+                else:
+                    draft_probs.append(scores.softmax(dim=-1))
+                    proposals.append(int(torch.multinomial(draft_probs[-1], 1)))
+                if proposals[-1] == eos_token_id:
+                    break
+
+            logits = main.logits(tokens + proposals)[-len(proposals) - 1:]
+            steps += 1
+            drafted += len(proposals)
+            for i, logit in enumerate(logits):
+                scores = self._scores(processors, warpers, tokens, logit)
+                if warpers is None:
+                    token = int(scores.argmax())
+                    if i < len(proposals) and token == proposals[i]:
+                        tokens.append(token)
+                        accepted += 1
+                        if token == eos_token_id:
+                            break
+                        continue
+                else:
+                    probs = scores.softmax(dim=-1)
+                    if i < len(proposals):
+                        token = proposals[i]
+                        if float(torch.rand(())) * draft_probs[i][token] < probs[token]:
+                            tokens.append(token)
+                            accepted += 1
+                            if token == eos_token_id:
+                                break
+                            continue
+
+                        residual = (probs - draft_probs[i]).clamp(min=0)
+                        probs = residual if float(residual.sum()) > 0 else probs
+                    token = int(torch.multinomial(probs, 1))
+
+                tokens.append(token)
+                break
+
+            # the last token is fed on the next step
+            main.rewind(len(tokens) - 1)
+            draft.rewind(len(tokens) - 1)
+
+        with self._lock:
+            self.sequences += 1
+            self.steps += steps
+            self.tokens += len(tokens) - 1
+            self.drafted += drafted
+            self.accepted += accepted
+
+        return tokens
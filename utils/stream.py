@@ -0,0 +1,52 @@
+from utils.parser import SECTIONS
+
+
+class RecipeStreamParser:
+    """
+    Incrementally builds the `_skip_special_tokens_and_prettify` dict from decoded token pieces.
+
+    `finished` holds the sections closed by a `<section>` token. Ingredients and directions only
+    expose items that were already closed by `<sep>`, so nothing half generated is shown.
+    """
+
+    def __init__(self, special_tokens=()):
+        self.special_tokens = set(special_tokens) - {"<sep>", "<section>"}
+        self.recipe = {"title": "", "ingredients": [], "directions": []}
+        self.finished = set()
+        self.section = ""
+
+    def feed(self, piece):
+        if piece == "<section>":
+            self._parse_section(final=True)
+            self.section = ""
+        elif piece not in self.special_tokens:
+            self.section += piece
+            if piece == "<sep>":
+                self._parse_section(final=False)
+
+        return self.recipe
+
+    def close(self):
+        self._parse_section(final=True)
+        return self.recipe
+
+    def _parse_section(self, final):
+        section = self.section.strip()
+        for name in SECTIONS:
+            if section.startswith(f"{name}:"):
+                break
+        else:
+            return
+
+        section = section.replace(f"{name}:", "")
+        if name == "title":
+            if not final:
+                return
+
+            self.recipe["title"] = " ".join([w.strip().capitalize() for w in section.strip().split() if w.strip()])
+        else:
+            values = [s.strip() for s in section.split("<sep>")]
+            self.recipe[name] = values if final else values[:-1]
+
+        if final:
+            self.finished.add(name)
@@ -0,0 +1,242 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+TOKEN_BUCKETS = (16, 32, 64, 128, 192, 256, 320, 384, 448, 512)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the `q` quantile (inf when it lies past the last bucket)."""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return bound
+
+        return 0.0
+
+
+class _Stage:
+    __slots__ = ("telemetry", "name", "start")
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.telemetry.observe("chef_stage_seconds", time.perf_counter() - self.start, stage=self.name)
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Telemetry:
+    """
+    In-process metrics registry: histograms, counters and gauges read on export.
+
+    `stage(name)` times a block into the `chef_stage_seconds` histogram. Gauges are callables
+    evaluated on `snapshot`/`render`, so cache hit ratios and queue depths cost nothing between
+    scrapes. Everything is exported as Prometheus text (`render`) or as a JSON document (`snapshot`).
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self._dumper = None
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def timed(self, name, fn):
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    def observe(self, metric, value, buckets=SECONDS_BUCKETS, **labels):
+        key = (metric, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+
+            histogram.observe(value)
+
+    def count(self, metric, value=1, **labels):
+        key = (metric, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, metric, fn, kind="gauge", **labels):
+        """Registers `fn()` to be read at export time; `kind="counter"` for totals kept elsewhere."""
+        with self._lock:
+            self._gauges[(metric, _labels(labels))] = (fn, kind)
+
+    def _read_gauges(self):
+        with self._lock:
+            gauges = list(self._gauges.items())
+
+        values = []
+        for (metric, labels), (fn, kind) in gauges:
+            try:
+                values.append((metric, labels, kind, float(fn())))
+            except Exception:
+                continue
+
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            histograms = [
+                (metric, labels, h.count, h.sum, h.quantile(0.5), h.quantile(0.95))
+                for (metric, labels), h in self._histograms.items()
+            ]
+            counters = list(self._counters.items())
+
+        data = {"time": time.time(), "uptime_seconds": time.time() - self.started, "histograms": [], "values": []}
+        for metric, labels, count, total, p50, p95 in histograms:
+            data["histograms"].append({
+                "name": metric, "labels": dict(labels), "count": count, "sum": total,
+                "mean": total / count if count else 0.0, "p50": p50, "p95": p95,
+            })
+
+        for (metric, labels), value in counters:
+            data["values"].append({"name": metric, "labels": dict(labels), "value": value})
+
+        for metric, labels, _, value in self._read_gauges():
+            data["values"].append({"name": metric, "labels": dict(labels), "value": value})
+
+        return data
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            histograms = [
+                (metric, labels, h.buckets, list(h.counts), h.count, h.sum)
+                for (metric, labels), h in self._histograms.items()
+            ]
+            counters = list(self._counters.items())
+
+        lines, typed = [], set()
+
+        def declare(metric, kind):
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} {kind}")
+
+        for metric, labels, buckets, counts, count, total in sorted(histograms):
+            declare(metric, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+
+        for (metric, labels), value in sorted(counters):
+            declare(metric, "counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        for metric, labels, kind, value in sorted(self._read_gauges()):
+            declare(metric, kind)
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+        os.replace(tmp, path)
+
+    def start_dump(self, path, interval=60.0):
+        """Rewrites `path` with a JSON snapshot every `interval` seconds from a daemon thread."""
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    logger.warning("Could not write metrics to %s: %s", path, e)
+
+        if self._dumper is None:
+            self._dumper = threading.Thread(target=run, name="metrics-dump", daemon=True)
+            self._dumper.start()
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTelemetry:
+    """Drop-in for `Telemetry` when metrics are off: every call is a constant no-op."""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def timed(self, name, fn):
+        return fn
+
+    def observe(self, metric, value, buckets=None, **labels):
+        pass
+
+    def count(self, metric, value=1, **labels):
+        pass
+
+    def gauge(self, metric, fn, kind="gauge", **labels):
+        pass
+
+
+NULL_TELEMETRY = NullTelemetry()
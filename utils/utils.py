@@ -4,6 +4,7 @@ from io import BytesIO
 from PIL import Image
 import requests
 import re
+from functools import lru_cache
 
 
 def load_image_from_local(image_path, image_resize=None):
@@ -68,6 +69,11 @@ def pure_comma_separation(list_str, return_list=True):
     return ", ".join(r)
 
 
+@lru_cache(maxsize=256)
+def _compile_keys(keys):
+    return re.compile("|".join(map(re.escape, keys)))
+
+
 def replace_regex(text, map_dict):
-    pattern = "|".join(map(re.escape, map_dict.keys()))
-    return re.sub(pattern, lambda m: map_dict[m.group()], str(text))
+    pattern = _compile_keys(tuple(map_dict.keys()))
+    return pattern.sub(lambda m: map_dict[m.group()], str(text))
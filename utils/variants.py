@@ -0,0 +1,26 @@
+import difflib
+import re
+
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+def title_words(title):
+    return _WORDS.findall(title.lower())
+
+
+def similar_titles(a, b, threshold=0.85):
+    words_a, words_b = title_words(a), title_words(b)
+    # "Chicken Rice Bowl" and "Rice Chicken Bowl" are the same dish
+    if set(words_a) == set(words_b):
+        return True
+
+    return difflib.SequenceMatcher(None, " ".join(words_a), " ".join(words_b)).ratio() >= threshold
+
+
+def dedupe_recipes(recipes, threshold=0.85):
+    kept = []
+    for recipe in recipes:
+        if not any(similar_titles(recipe["title"], other["title"], threshold) for other in kept):
+            kept.append(recipe)
+
+    return kept
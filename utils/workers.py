@@ -0,0 +1,170 @@
+import gc
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+
+def _to_lists(value):
+    # tensors go back to the parent as plain lists, no torch reductions or shared storages involved
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_to_lists(v) for v in value]
+    return value
+
+
+def _worker_main(index, generate_fn, inbox, outbox, threads, cpus):
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+            torch.set_num_interop_threads(1)
+        except (ImportError, RuntimeError):
+            pass
+
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+
+        job_id, items_list, generation_kwargs = job
+        try:
+            outbox.put((index, job_id, _to_lists(generate_fn(items_list, generation_kwargs)), None))
+        except Exception as e:
+            outbox.put((index, job_id, None, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class WorkerPool:
+    """
+    Runs `generate_fn(items_list, generation_kwargs)` in `num_workers` forked processes.
+
+    The model is loaded once in the parent before forking and the workers share its weights through
+    copy-on-write, as inference never writes to them. Each worker gets its own torch
+    thread budget (and cores, where the OS allows pinning) and a job goes to the worker with the
+    fewest jobs in flight.
+    """
+
+    def __init__(self, generate_fn, num_workers, threads_per_worker=None):
+        self.generate_fn = generate_fn
+        self.num_workers = max(1, int(num_workers))
+        cpu_count = os.cpu_count() or 1
+        self.threads_per_worker = int(threads_per_worker or max(1, cpu_count // self.num_workers))
+        self._processes = []
+        self._inboxes = []
+        self._outbox = None
+        self._in_flight = [0] * self.num_workers
+        self._jobs = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._collector = None
+
+    def _cpus(self, index):
+        if not hasattr(os, "sched_getaffinity"):
+            return None
+
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < self.num_workers * self.threads_per_worker:
+            return None
+
+        return cpus[index * self.threads_per_worker:(index + 1) * self.threads_per_worker]
+
+    def start(self):
+        if self._processes:
+            return
+
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("The worker pool shares the loaded model by forking, which this platform lacks")
+
+        # objects that exist before the fork are never touched by the cycle collector afterwards,
+        # which keeps their pages shared instead of copied on write
+        gc.collect()
+        gc.freeze()
+
+        ctx = multiprocessing.get_context("fork")
+        self._outbox = ctx.Queue()
+        for index in range(self.num_workers):
+            inbox = ctx.Queue()
+            process = ctx.Process(
+                target=_worker_main,
+                args=(index, self.generate_fn, inbox, self._outbox, self.threads_per_worker, self._cpus(index)),
+                name=f"generation-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+
+        gc.unfreeze()
+        self._collector = threading.Thread(target=self._collect, name="generation-collector", daemon=True)
+        self._collector.start()
+
+    def qsize(self):
+        with self._lock:
+            return sum(self._in_flight)
+
+    def submit(self, items_list, generation_kwargs):
+        self.start()
+
+        alive = [index for index, process in enumerate(self._processes) if process.is_alive()]
+        if not alive:
+            raise RuntimeError("All generation workers have exited")
+
+        future = Future()
+        with self._lock:
+            index = min(alive, key=self._in_flight.__getitem__)
+            job_id = next(self._ids)
+            self._in_flight[index] += 1
+            self._jobs[job_id] = (index, future)
+
+        self._inboxes[index].put((job_id, list(items_list), dict(generation_kwargs)))
+        return future
+
+    def generate(self, items_list, generation_kwargs):
+        return self.submit(items_list, generation_kwargs).result()
+
+    def _finish(self, job_id, result, error):
+        with self._lock:
+            index, future = self._jobs.pop(job_id)
+            self._in_flight[index] -= 1
+
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _collect(self):
+        while True:
+            try:
+                _, job_id, result, error = self._outbox.get(timeout=1)
+            except queue.Empty:
+                self._fail_dead_workers()
+                continue
+
+            self._finish(job_id, result, error)
+
+    def _fail_dead_workers(self):
+        dead = {index for index, process in enumerate(self._processes) if not process.is_alive()}
+        if not dead:
+            return
+
+        with self._lock:
+            job_ids = [job_id for job_id, (index, _) in self._jobs.items() if index in dead]
+
+        for job_id in job_ids:
+            self._finish(job_id, None, RuntimeError("Generation worker exited unexpectedly"))
+
+    def close(self):
+        for inbox in self._inboxes:
+            inbox.put(None)
+
+        for process in self._processes:
+            process.join(timeout=5)
+
+        self._processes = []
+        self._inboxes = []